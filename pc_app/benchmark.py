@@ -0,0 +1,457 @@
+"""
+Headless detector benchmarks. Needs no display or network.
+
+    python benchmark.py suite       # throughput, latency and accuracy of every matcher configuration
+    python benchmark.py backends    # where each matcher backend wins
+    python benchmark.py soak        # steady-state allocations and peak RSS
+    python benchmark.py replay DIR_OR_VIDEO   # per-frame scores and matches of a recording
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2  # type: ignore
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from detector import (
+    BACKENDS,
+    COLOR_MODES,
+    ENGINES,
+    DetectionEngine,
+    ReplaySource,
+    TemplateSpec,
+    _read_template,
+    _rescale_template,
+    replay,
+)
+
+TEMPLATE_PATH = BASE_DIR.parent / "Accept.png"
+
+FRAME_SIZES: Dict[str, Tuple[int, int]] = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+    "3x1080p": (5760, 1080),
+    "3x1440p": (7680, 1440),
+}
+
+
+def _synthetic_frame(width: int, height: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (9, 9), 0)
+
+
+# Button scales of the simulated displays; each screen also gets a few percent of jitter.
+DISPLAY_SCALES = (0.75, 1.0, 1.25, 1.5)
+
+
+def _screen_sequence(
+    width: int,
+    height: int,
+    source: np.ndarray,
+    frames: int,
+    positive_ratio: float = 0.5,
+    seed: int = 0,
+) -> Tuple[List[np.ndarray], List[bool], float]:
+    """BGRA screenshots of one simulated display, with the truth for each frame.
+
+    The button comes and goes in short runs of frames, covering about
+    ``positive_ratio`` of them, at the display's scale and at a fresh random
+    position each time it appears. Every frame gets sensor-style noise and a JPEG
+    round trip at a random quality, as in streamed or recompressed screenshots.
+    """
+    rng = np.random.default_rng(seed)
+    scale = float(rng.choice(DISPLAY_SCALES)) * float(rng.uniform(0.97, 1.03))
+    templ = _rescale_template(source, scale)
+    th, tw = templ.shape[:2]
+    background = _synthetic_frame(width, height, seed)
+    screens: List[np.ndarray] = []
+    truth: List[bool] = []
+    present = False
+    run_left = 0
+    x = y = 0
+    for _ in range(frames):
+        if run_left == 0:
+            present = bool(rng.random() < positive_ratio)
+            run_left = int(rng.integers(1, 6))
+            y = int(rng.integers(0, height - th))
+            x = int(rng.integers(0, width - tw))
+        run_left -= 1
+        screen = background.copy()
+        if present:
+            screen[y:y + th, x:x + tw] = templ
+        noise = rng.normal(0.0, 4.0, screen.shape).astype(np.int16)
+        screen = np.clip(screen.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        quality = int(rng.integers(60, 95))
+        _ok, encoded = cv2.imencode(".jpg", screen, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        screen = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        screens.append(cv2.cvtColor(screen, cv2.COLOR_BGR2BGRA))
+        truth.append(present)
+    return screens, truth, scale
+
+
+def benchmark_suite(
+    frame_sizes: Sequence[str] = tuple(FRAME_SIZES),
+    engines: Sequence[str] = tuple(ENGINES),
+    backends: Sequence[str] = tuple(BACKENDS),
+    color_modes: Sequence[str] = COLOR_MODES,
+    frames: int = 20,
+    threshold: float = 0.7,
+    seed: int = 0,
+    roi_tracking: bool = True,
+) -> List[dict]:
+    """Run every matcher configuration over the same synthetic screens.
+
+    Each frame size is one simulated display with its own button scale. Before
+    timing, every configuration sees one frame with the button so scale
+    calibration has locked on, as it would from an earlier session's cache. With
+    ``roi_tracking`` a button that reappears elsewhere is only found once the ROI
+    gives up, so compare hit rates with and without it.
+    """
+    source = _read_template(str(TEMPLATE_PATH))
+    rows = []
+    for size_index, size_name in enumerate(frame_sizes):
+        width, height = FRAME_SIZES[size_name]
+        screens, truth, scale = _screen_sequence(width, height, source, frames, seed=seed + size_index)
+        calibration_frame = _screen_sequence(width, height, source, 1, positive_ratio=1.0, seed=seed + size_index)[0][0]
+        for engine, backend, color_mode in itertools.product(engines, backends, color_modes):
+            with tempfile.TemporaryDirectory(prefix="omnicall-bench-") as cache_dir:
+                row = _run_configuration(
+                    screens, truth, calibration_frame, engine, backend, color_mode, threshold, Path(cache_dir), roi_tracking
+                )
+            row.update({"frame": size_name, "scale": scale, "engine": engine, "backend": backend, "color_mode": color_mode})
+            rows.append(row)
+    return rows
+
+
+def _run_configuration(
+    screens: Sequence[np.ndarray],
+    truth: Sequence[bool],
+    calibration_frame: np.ndarray,
+    engine: str,
+    backend: str,
+    color_mode: str,
+    threshold: float,
+    cache_dir: Path,
+    roi_tracking: bool,
+) -> dict:
+    detection = DetectionEngine(
+        [TemplateSpec(str(TEMPLATE_PATH), threshold)],
+        engine=engine,
+        backend=backend,
+        color_mode=color_mode,
+        roi_tracking=roi_tracking,
+        static_gating=False,
+        workers=2,
+        scale_cache_dir=cache_dir,
+    )
+    detection.open()
+    try:
+        detection.score(calibration_frame, detection.states)
+        state = detection.states[0]
+        tracemalloc.start()
+        baseline, _peak = tracemalloc.get_traced_memory()
+        latencies = []
+        hits = misses = false_alarms = 0
+        started = time.perf_counter()
+        for screen, present in zip(screens, truth):
+            start = time.perf_counter()
+            detection.score(screen, detection.states)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            detected = state.score >= threshold
+            if present:
+                hits += detected
+                misses += not detected
+            else:
+                false_alarms += detected
+        elapsed = time.perf_counter() - started
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        detection.close()
+    positives = sum(truth)
+    negatives = len(truth) - positives
+    return {
+        "fps": len(screens) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "peak_bytes": peak - baseline + detection.pool.nbytes,
+        "hit_rate": hits / positives if positives else None,
+        "miss_rate": misses / positives if positives else None,
+        "false_alarm_rate": false_alarms / negatives if negatives else None,
+    }
+
+
+def _print_suite(rows: List[dict]) -> None:
+    columns = ("fps", "p50_ms", "p95_ms", "p99_ms", "peak_MiB", "hit", "miss", "false")
+    print(f"{'frame':<10}{'scale':>6}  {'engine':<9}{'backend':<8}{'color':<7}" + "".join(f"{name:>10}" for name in columns))
+    for row in rows:
+        rates = [row["hit_rate"], row["miss_rate"], row["false_alarm_rate"]]
+        values = [row["fps"], row["p50_ms"], row["p95_ms"], row["p99_ms"], row["peak_bytes"] / (1024 * 1024)]
+        print(
+            f"{row['frame']:<10}{row['scale']:>6.2f}  {row['engine']:<9}{row['backend']:<8}{row['color_mode']:<7}"
+            + "".join(f"{value:>10.1f}" for value in values)
+            + "".join(f"{'n/a':>10}" if rate is None else f"{rate:>10.0%}" for rate in rates)
+        )
+    print(f"peak RSS {(_peak_rss_bytes() or 0) / (1024 * 1024):.1f} MiB")
+
+
+def benchmark_backends(
+    frame_sizes: Sequence[str] = ("1080p", "1440p", "4k"),
+    template_scales: Sequence[float] = (0.5, 1.0, 2.0),
+    repeats: int = 3,
+) -> List[dict]:
+    """Median milliseconds per full-frame correlation for every backend."""
+    source = _read_template(str(TEMPLATE_PATH))
+    rows = []
+    for size_name in frame_sizes:
+        width, height = FRAME_SIZES[size_name]
+        frame = _synthetic_frame(width, height)
+        for scale in template_scales:
+            templ = _rescale_template(source, scale)
+            row = {"frame": size_name, "template": f"{templ.shape[1]}x{templ.shape[0]}"}
+            for name, factory in BACKENDS.items():
+                if name == "auto":
+                    continue
+                backend = factory()
+                backend.match(frame, templ)  # warm-up fills per-size caches
+                samples = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    backend.match(frame, templ)
+                    samples.append((time.perf_counter() - start) * 1000.0)
+                row[name] = float(np.median(samples))
+            row["winner"] = min((name for name in BACKENDS if name in row), key=lambda name: row[name])
+            rows.append(row)
+    return rows
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return _peak_rss_windows()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _peak_rss_windows() -> Optional[int]:
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return int(counters.PeakWorkingSetSize)
+    except Exception:
+        return None
+
+
+def soak(
+    minutes: float = 10.0,
+    frame_size: str = "1440p",
+    engine: str = "pyramid",
+    backend: str = "opencv",
+    color_mode: str = "bgr",
+    warmup_frames: int = 20,
+) -> dict:
+    """Run the detection engine flat out over synthetic frames and report its memory profile.
+
+    Frames alternate between containing the template and not, so ROI tracking,
+    full scans and verification windows are all exercised. Buffer-pool
+    allocations and traced NumPy/OpenCV memory are measured after ``warmup_frames``.
+    """
+    width, height = FRAME_SIZES[frame_size]
+    source = _read_template(str(TEMPLATE_PATH))
+    background = cv2.cvtColor(_synthetic_frame(width, height), cv2.COLOR_BGR2BGRA)
+    with_button = background.copy()
+    th, tw = source.shape[:2]
+    y, x = height // 3, width // 3
+    with_button[y:y + th, x:x + tw, :3] = source
+    frames = [background, with_button]
+
+    detection = DetectionEngine(
+        [TemplateSpec(str(TEMPLATE_PATH), 0.7)],
+        engine=engine,
+        backend=backend,
+        color_mode=color_mode,
+        static_gating=False,
+        scale_calibration=False,
+        workers=2,
+    )
+    detection.open()
+    try:
+        for index in range(warmup_frames):
+            detection.score(frames[index % 2], detection.states)
+        warm_allocations = detection.pool.allocations
+        tracemalloc.start()
+        baseline, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        latencies = []
+        deadline = time.perf_counter() + minutes * 60.0
+        index = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            detection.score(frames[index % 2], detection.states)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            index += 1
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        detection.close()
+    return {
+        "frames": index,
+        "fps": index / (minutes * 60.0) if minutes > 0 else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "pool_allocations_warmup": warm_allocations,
+        "pool_allocations_steady": detection.pool.allocations - warm_allocations,
+        "pool_bytes": detection.pool.nbytes,
+        "traced_growth_bytes": current - baseline,
+        "traced_peak_per_frame_bytes": peak - baseline,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+
+def run_replay(
+    path: str,
+    threshold: float = 0.7,
+    debounce_seconds: float = 4.0,
+    fps: float = 4.0,
+    engine: str = "pyramid",
+    backend: str = "opencv",
+    color_mode: str = "bgr",
+    template: str = str(TEMPLATE_PATH),
+) -> dict:
+    """Print a recording's per-frame scores and match events; returns the throughput summary."""
+    frames = matches = 0
+    # Calibrate from scratch into a throwaway cache, so a replay neither reads nor writes the app's scales.
+    with tempfile.TemporaryDirectory(prefix="omnicall-replay-") as cache_dir:
+        detection = DetectionEngine(
+            [TemplateSpec(template, threshold)],
+            engine=engine,
+            backend=backend,
+            color_mode=color_mode,
+            scale_cache_dir=Path(cache_dir),
+        )
+        start = time.perf_counter()
+        for record in replay(ReplaySource(path, fps), detection, debounce_seconds):
+            frames += 1
+            matches += len(record["matches"])
+            scores = "  ".join(
+                f"{name}={'cooldown' if score is None else f'{score:.3f}'}" for name, score in record["scores"].items()
+            )
+            events = "  MATCH " + ", ".join(record["matches"]) if record["matches"] else ""
+            print(f"{record['time']:>9.2f}s  {record['frame']:<28}{scores}{events}")
+        elapsed = time.perf_counter() - start
+    return {
+        "frames": frames,
+        "matches": matches,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "frames_scored": detection.frames_scored,
+        "frames_skipped": detection.frames_skipped,
+    }
+
+
+def _print_soak(report: dict) -> None:
+    for key, value in report.items():
+        if value is None:
+            value = "n/a"
+        elif key.endswith("_bytes"):
+            value = f"{value / (1024 * 1024):.1f} MiB"
+        elif isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"{key:<30}{value}")
+
+
+def _print_backends(rows: List[dict]) -> None:
+    names = [name for name in BACKENDS if name != "auto"]
+    print(f"{'frame':<10}{'template':<12}" + "".join(f"{name + ' ms':>12}" for name in names) + f"{'winner':>10}")
+    for row in rows:
+        print(f"{row['frame']:<10}{row['template']:<12}" + "".join(f"{row[name]:>12.1f}" for name in names) + f"{row['winner']:>10}")
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    suite = sub.add_parser("suite", help="run every matcher configuration over synthetic screens")
+    suite.add_argument("--frames-per-size", type=int, default=20)
+    suite.add_argument("--sizes", nargs="+", default=list(FRAME_SIZES), choices=sorted(FRAME_SIZES))
+    suite.add_argument("--engines", nargs="+", default=list(ENGINES), choices=sorted(ENGINES))
+    suite.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=sorted(BACKENDS))
+    suite.add_argument("--color-modes", nargs="+", default=list(COLOR_MODES), choices=COLOR_MODES)
+    suite.add_argument("--threshold", type=float, default=0.7)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--no-roi", action="store_true", help="scan the whole frame every time")
+    backends = sub.add_parser("backends", help="compare matcher backends across frame and template sizes")
+    backends.add_argument("--frames", nargs="+", default=["1080p", "1440p", "4k"], choices=sorted(FRAME_SIZES))
+    backends.add_argument("--scales", nargs="+", type=float, default=[0.5, 1.0, 2.0])
+    backends.add_argument("--repeats", type=int, default=3)
+    soak_parser = sub.add_parser("soak", help="run the engine for a while and report allocations and peak RSS")
+    soak_parser.add_argument("--minutes", type=float, default=10.0)
+    soak_parser.add_argument("--frame", default="1440p", choices=sorted(FRAME_SIZES))
+    soak_parser.add_argument("--engine", default="pyramid", choices=sorted(ENGINES))
+    soak_parser.add_argument("--backend", default="opencv", choices=sorted(BACKENDS))
+    soak_parser.add_argument("--color-mode", default="bgr", choices=COLOR_MODES)
+    replay_parser = sub.add_parser("replay", help="score a directory of screenshots or a video file at full speed")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--threshold", type=float, default=0.7)
+    replay_parser.add_argument("--debounce", type=float, default=4.0, help="seconds between notifications")
+    replay_parser.add_argument("--fps", type=float, default=4.0, help="capture rate the screenshots were taken at")
+    replay_parser.add_argument("--engine", default="pyramid", choices=sorted(ENGINES))
+    replay_parser.add_argument("--backend", default="opencv", choices=sorted(BACKENDS))
+    replay_parser.add_argument("--color-mode", default="bgr", choices=COLOR_MODES)
+    replay_parser.add_argument("--template", default=str(TEMPLATE_PATH))
+    args = parser.parse_args(argv)
+
+    if args.command == "suite":
+        rows = benchmark_suite(
+            args.sizes, args.engines, args.backends, args.color_modes, args.frames_per_size, args.threshold, args.seed, not args.no_roi
+        )
+        _print_suite(rows)
+    elif args.command == "backends":
+        _print_backends(benchmark_backends(args.frames, args.scales, args.repeats))
+    elif args.command == "soak":
+        _print_soak(soak(args.minutes, args.frame, args.engine, args.backend, args.color_mode))
+    elif args.command == "replay":
+        _print_soak(
+            run_replay(
+                args.path, args.threshold, args.debounce, args.fps, args.engine, args.backend, args.color_mode, args.template
+            )
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
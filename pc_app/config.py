@@ -15,6 +15,19 @@ DEFAULT_CONFIG: Dict[str, Any] = {
     "threshold": 0.8,
     "debounce_seconds": 10,
     "poll_ms": 200,
+    "poll_min_ms": 50,
+    "poll_max_ms": 1000,
+    "capture_monitor": 0,
+    "capture_region": None,
+    "pipeline_consumers": 0,
+    "color_prefilter": False,
+    "detector_process": False,
+    "publish_frames": False,
+    "cpu_budget": None,
+    "flight_recorder": False,
+    "flight_recorder_seconds": 10,
+    "flight_recorder_mb": 16,
+    "flight_recorder_dumps": 20,
     "last_match_ts": None,
     "total_matches": 0,
 }
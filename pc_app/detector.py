@@ -1,64 +1,1125 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import math
+import queue
+import shutil
+import struct
+import sys
 import threading
 import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from multiprocessing import shared_memory
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
 
 import cv2  # type: ignore
 import mss  # type: ignore
 import numpy as np
 from PyQt6 import QtCore
 
+from config import APP_DIR
+
+Match = Tuple[float, Tuple[int, int]]
+Matcher = Callable[["_Frame", np.ndarray], Match]
+
+# Cooldown after a notification that reached no device, so a failing send is retried soon.
+FAILED_SEND_COOLDOWN = 3
+
+
+@dataclass
+class ColorPrefilter:
+    """Colour range that must be present before a template is matched at all.
+
+    The frame is thresholded at ``scale`` in HSV (OpenCV ranges: hue 0-179) or
+    BGR, and only connected blobs whose size is within ``size_tolerance`` of the
+    template's and whose aspect ratio is within ``aspect_tolerance`` of it become
+    candidate rectangles for ``matchTemplate``, largest first, at most
+    ``max_candidates`` of them.
+    """
+
+    lower: Tuple[int, int, int]
+    upper: Tuple[int, int, int]
+    space: str = "hsv"
+    scale: float = 0.25
+    size_tolerance: float = 2.0
+    aspect_tolerance: float = 0.5
+    max_candidates: int = 8
+
+    def __post_init__(self) -> None:
+        if self.space not in ("hsv", "bgr"):
+            raise ValueError(f"Unknown prefilter colour space: {self.space}")
+
+    def candidates(self, frame: "_Frame", templ_shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+        """Full-resolution ``(x0, y0, x1, y1)`` windows worth matching ``templ_shape`` in."""
+        small = frame.raw_downsampled(self.scale)
+        pool = frame.pool
+        if small.ndim == 3 and small.shape[2] == 4:
+            small = cv2.cvtColor(small, cv2.COLOR_BGRA2BGR, dst=pool.get(f"prefilter-bgr@{self.scale}", small.shape[:2] + (3,)))
+        if self.space == "hsv":
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2HSV, dst=pool.get(f"prefilter-hsv@{self.scale}", small.shape))
+        mask = cv2.inRange(small, self.lower, self.upper, dst=pool.get(f"prefilter-mask@{self.scale}", small.shape[:2]))
+        # Closing bridges the holes the button's label punches into the mask.
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, _PREFILTER_KERNEL, dst=mask)
+        count, _labels, stats, _centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        th, tw = templ_shape[:2]
+        expected_w, expected_h = tw * self.scale, th * self.scale
+        aspect = tw / th
+        height, width = frame.shape
+        pad = int(math.ceil(2 / self.scale))
+        windows = []
+        blobs = sorted(stats[1:count].tolist(), key=lambda blob: blob[4], reverse=True)
+        for x, y, w, h, _area in blobs:
+            if len(windows) >= self.max_candidates:
+                break
+            if not (expected_w / self.size_tolerance <= w <= expected_w * self.size_tolerance):
+                continue
+            if not (expected_h / self.size_tolerance <= h <= expected_h * self.size_tolerance):
+                continue
+            if abs(w / h - aspect) > aspect * self.aspect_tolerance:
+                continue
+            x0 = int(x / self.scale) - pad
+            y0 = int(y / self.scale) - pad
+            # Never smaller than the template, so matchTemplate always has room.
+            x1 = max(int((x + w) / self.scale) + pad, x0 + tw)
+            y1 = max(int((y + h) / self.scale) + pad, y0 + th)
+            x0, y0 = max(0, min(x0, width - tw)), max(0, min(y0, height - th))
+            windows.append((x0, y0, min(width, x1), min(height, y1)))
+        return windows
+
+
+_PREFILTER_KERNEL = np.ones((3, 3), np.uint8)
+
+
+@dataclass
+class TemplateSpec:
+    path: str
+    threshold: float
+    name: str = "accept"
+    # Optional colour gate: frames without a matching blob score 0 without being matched.
+    prefilter: Optional[ColorPrefilter] = None
+
+
+class StageTimings:
+    """Rolling latency windows for each stage of the detector loop.
+
+    ``record`` is cheap enough for the hot path (an append under a lock);
+    percentiles are only computed when someone asks for a ``snapshot``. Safe to
+    read from any thread.
+    """
+
+    STAGES = ("capture", "convert", "match", "notify", "sleep")
+
+    def __init__(self, window: int = 256) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples: Dict[str, Deque[float]] = {stage: deque(maxlen=self.window) for stage in self.STAGES}
+            self._frames: Deque[float] = deque(maxlen=self.window)
+            self.frames = 0
+            self.overruns = 0
+            self.missed_deadlines = 0
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def frame(self) -> None:
+        """Mark one captured frame, for the FPS counter."""
+        with self._lock:
+            self._frames.append(time.perf_counter())
+            self.frames += 1
+
+    def overrun(self, missed: int) -> None:
+        """Count one loop iteration that ran past its deadline, skipping ``missed`` deadlines."""
+        with self._lock:
+            self.overruns += 1
+            self.missed_deadlines += missed
+
+    def snapshot(self) -> Dict[str, Any]:
+        """``{"fps", "frames", "overruns", "missed_deadlines", "stages": {stage: {"p50_ms", "p95_ms", "p99_ms", "count"}}}``."""
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+            stamps = list(self._frames)
+            frames = self.frames
+            overruns = self.overruns
+            missed = self.missed_deadlines
+        span = stamps[-1] - stamps[0] if len(stamps) > 1 else 0.0
+        stages = {}
+        for stage, values in samples.items():
+            if values:
+                p50, p95, p99 = np.percentile(values, (50, 95, 99)) * 1000.0
+            else:
+                p50 = p95 = p99 = 0.0
+            stages[stage] = {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "count": len(values)}
+        return {
+            "fps": (len(stamps) - 1) / span if span > 0 else 0.0,
+            "frames": frames,
+            "overruns": overruns,
+            "missed_deadlines": missed,
+            "stages": stages,
+        }
+
+
+class DetectionEngine:
+    """Capture-independent detection core shared by every way of running the detector.
+
+    Owns the prepared templates with their matchers, the static-frame gate and the
+    buffer pool that all per-frame intermediates are drawn from. ``open`` loads the
+    templates; ``score`` runs one captured BGRA (or BGR) frame through them.
+    """
+
+    def __init__(
+        self,
+        templates: Sequence[TemplateSpec],
+        engine: str = "full",
+        backend: str = "opencv",
+        color_mode: str = "bgr",
+        roi_tracking: bool = True,
+        roi_margin: int = 48,
+        roi_full_scan_every: int = 10,
+        roi_max_misses: int = 5,
+        static_gating: bool = True,
+        static_tolerance: int = 3,
+        scale_calibration: bool = True,
+        workers: int = 1,
+        scale_cache_dir: Optional[Path] = None,
+    ) -> None:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown detector engine: {engine}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown matcher backend: {backend}")
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"Unknown color mode: {color_mode}")
+        self.templates = list(templates)
+        self.engine = engine
+        self.backend = backend
+        self.color_mode = color_mode
+        self.roi_tracking = roi_tracking
+        self.roi_margin = roi_margin
+        self.roi_full_scan_every = roi_full_scan_every
+        self.roi_max_misses = roi_max_misses
+        self.static_gating = static_gating
+        self.static_tolerance = static_tolerance
+        self.scale_calibration = scale_calibration
+        self.workers = max(1, workers)
+        self.scale_cache_dir = scale_cache_dir if scale_cache_dir is not None else APP_DIR
+        self.pool = _BufferPool()
+        self.timings = StageTimings()
+        self.states: List[_TemplateState] = []
+        self.frames_scored = 0
+        self.frames_skipped = 0
+        # The frame the last ``score`` call matched, or None if the gate skipped it.
+        self.last_frame: Optional[_Frame] = None
+        # Index into QUALITY_LEVELS; 0 is the setup configured above.
+        self.quality = 0
+        self._base = (engine, color_mode, roi_full_scan_every)
+        self._gate: Optional[_FrameGate] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def open(self) -> None:
+        self.close()
+        self.engine, self.color_mode, self.roi_full_scan_every = self._base
+        if self.engine == "tiled":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="omnicall-match")
+        self.quality = 0
+        self.states = [self._load_state(spec) for spec in self.templates]
+        self._gate = _FrameGate(self.static_tolerance) if self.static_gating else None
+        self.frames_scored = 0
+        self.frames_skipped = 0
+        self.timings.reset()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def reset(self) -> None:
+        """Forget the last scored frame, e.g. after a capture error."""
+        if self._gate is not None:
+            self._gate.reset()
+
+    def active(self, now: float) -> List["_TemplateState"]:
+        return [state for state in self.states if now >= state.cooldown_until]
+
+    def score(self, raw: np.ndarray, states: Sequence["_TemplateState"]) -> bool:
+        """Score ``raw`` against ``states``; returns True if the gate saw the screen change.
+
+        On a static frame the previous scores are kept, but only for templates
+        scored since the gate last let a frame through; any that were left out
+        then (e.g. cooling down) are matched now rather than reporting a stale score.
+        """
+        start = time.perf_counter()
+        changed = self._gate is not None
+        if self._gate is not None and not self._gate.changed(raw):
+            changed = False
+            states = [state for state in states if state.generation != self._gate.generation]
+            if not states:
+                self.frames_skipped += 1
+                self.last_frame = None
+                self.timings.record("match", time.perf_counter() - start)
+                return False
+        # One frame per poll, shared by every template. Colour conversion happens
+        # lazily, only for the areas matchers read, and is timed separately.
+        frame = self.last_frame = _Frame(raw, self.color_mode, self.pool)
+        generation = self._gate.generation if self._gate is not None else 0
+        for state in states:
+            state.score = state.match(frame)
+            state.generation = generation
+        self.frames_scored += 1
+        self.timings.record("convert", frame.convert_seconds)
+        self.timings.record("match", time.perf_counter() - start - frame.convert_seconds)
+        return changed
+
+    def closest(self) -> "_TemplateState":
+        return max(self.states, key=lambda state: state.score - state.spec.threshold)
+
+    @staticmethod
+    def hits(states: Sequence["_TemplateState"]) -> List["_TemplateState"]:
+        """The scored ``states`` at or above their threshold, i.e. the ones to notify for."""
+        return [state for state in states if state.score >= state.spec.threshold]
+
+    @staticmethod
+    def cool_down(state: "_TemplateState", now: float, debounce_seconds: float, delivered: bool) -> None:
+        """Mute ``state`` after a notification: for the debounce if it was delivered, briefly otherwise."""
+        cooldown = debounce_seconds if delivered else FAILED_SEND_COOLDOWN
+        state.cooldown_until = now + max(1, cooldown)
+
+    def set_quality(self, level: int) -> None:
+        """Move to rung ``level`` of ``QUALITY_LEVELS``, re-preparing templates and matchers.
+
+        Call between frames, from the thread that scores them.
+        """
+        level = max(0, min(level, len(QUALITY_LEVELS) - 1))
+        if level == self.quality:
+            return
+        self.quality = level
+        step = QUALITY_LEVELS[level]
+        engine, color_mode, full_scan_every = self._base
+        # Only ever step towards something cheaper than what was configured.
+        if step.get("color_mode") and color_mode == "bgr":
+            color_mode = step["color_mode"]
+        if step.get("engine") and engine != "pyramid":
+            engine = step["engine"]
+        self.engine, self.color_mode = engine, color_mode
+        self.roi_full_scan_every = full_scan_every * step.get("full_scan_factor", 1)
+        for state in self.states:
+            state.set_color_mode(color_mode)
+            if state.spec.prefilter is not None:
+                continue
+            state.matcher = self._make_matcher(state.spec, step.get("coarse"), min(state.templ.shape[:2]))
+            if state.roi is not None:
+                state.roi.full_scan = state.matcher
+                state.roi.full_scan_every = max(1, self.roi_full_scan_every)
+
+    def _make_matcher(self, spec: TemplateSpec, coarse: Optional[float] = None, templ_size: int = 0) -> Matcher:
+        if spec.prefilter is not None:
+            return _PrefilterMatcher(spec.prefilter, BACKENDS[self.backend]())
+        if coarse is not None and self.engine == "pyramid":
+            # Never so coarse that the template drops below the pyramid's minimum and it falls back to a full scan.
+            if templ_size:
+                coarse = max(coarse, _PyramidMatcher.MIN_COARSE_SIZE / templ_size)
+            return _PyramidMatcher(scale=min(coarse, 0.25), backend=BACKENDS[self.backend]())
+        return ENGINES[self.engine](BACKENDS[self.backend](), pool=self._executor, workers=self.workers, stop_at=spec.threshold)
+
+    def _load_state(self, spec: TemplateSpec) -> "_TemplateState":
+        matcher = self._make_matcher(spec)
+        roi = _RoiTracker(self.roi_margin, self.roi_full_scan_every, self.roi_max_misses, matcher) if self.roi_tracking else None
+        cache = _ScaleCache(self.scale_cache_dir) if self.scale_calibration else None
+        return _TemplateState(spec, _read_template(spec.path), self.color_mode, matcher, roi, cache)
+
 
 class DetectorThread(QtCore.QThread):
-    match_detected = QtCore.pyqtSignal(float)
+    # (template name, score)
+    match_detected = QtCore.pyqtSignal(str, float)
     status = QtCore.pyqtSignal(str)
+    # StageTimings.snapshot(), at most once per timings_interval
+    timings_updated = QtCore.pyqtSignal(dict)
 
-    def __init__(self, template_path: str, threshold: float, debounce_seconds: int, poll_ms: int, on_match: Callable[[], bool], parent: Optional[QtCore.QObject] = None) -> None:
+    def __init__(
+        self,
+        template_path: str,
+        threshold: float,
+        debounce_seconds: int,
+        poll_ms: int,
+        on_match: Callable[[str], bool],
+        parent: Optional[QtCore.QObject] = None,
+        roi_tracking: bool = True,
+        roi_margin: int = 48,
+        roi_full_scan_every: int = 10,
+        roi_max_misses: int = 5,
+        engine: str = "full",
+        color_mode: str = "bgr",
+        static_gating: bool = True,
+        static_tolerance: int = 3,
+        min_poll_ms: Optional[int] = None,
+        max_poll_ms: Optional[int] = None,
+        templates: Optional[Sequence[TemplateSpec]] = None,
+        scale_calibration: bool = True,
+        backend: str = "opencv",
+        workers: int = 1,
+        capture_monitor: int = 0,
+        capture_region: Optional[Sequence[int]] = None,
+        timings_interval: float = 1.0,
+        capture: Optional[CaptureBackend] = None,
+        max_pending_sends: int = 4,
+        send_timeout: float = 30.0,
+        pipeline_consumers: int = 0,
+        publish_frames: Optional[str] = None,
+        cpu_budget: Optional[float] = None,
+        flight_recorder: Optional[FlightRecorder] = None,
+        near_miss_margin: float = 0.1,
+    ) -> None:
         super().__init__(parent)
         self.template_path = template_path
         self.threshold = threshold
+        self.templates: List[TemplateSpec] = list(templates) if templates else [TemplateSpec(template_path, threshold)]
+        # Scores, verdicts and recordings are keyed by name, so names must be unique.
+        names = [spec.name for spec in self.templates]
+        for name in names:
+            if names.count(name) > 1:
+                raise ValueError(f"Duplicate template name: {name}")
         self.debounce_seconds = debounce_seconds
         self.poll_ms = poll_ms
+        self._engine_options: Dict[str, Any] = dict(
+            engine=engine,
+            backend=backend,
+            color_mode=color_mode,
+            roi_tracking=roi_tracking,
+            roi_margin=roi_margin,
+            roi_full_scan_every=roi_full_scan_every,
+            roi_max_misses=roi_max_misses,
+            static_gating=static_gating,
+            static_tolerance=static_tolerance,
+            scale_calibration=scale_calibration,
+            workers=workers,
+        )
+        self.detection = DetectionEngine(self.templates, **self._engine_options)
+        # 0 matches inline on the capture thread. N > 0 runs the _FramePipeline:
+        # capture here, N matcher threads, and a decision thread that notifies.
+        self.pipeline_consumers = max(0, pipeline_consumers)
+        # Shared-memory ring name to publish every grab to (see FramePublisher), or None.
+        self.publish_frames = publish_frames
+        # Fraction of one core the inline loop may use (e.g. 0.05), traded against quality
+        # and poll rate by _QualityController; None for no limit. Ignored with a pipeline.
+        self.cpu_budget = cpu_budget
+        # Records scored frames; dumps on a match or a score within near_miss_margin below the threshold.
+        self.flight_recorder = flight_recorder
+        self.near_miss_margin = near_miss_margin
+        self._pipeline: Optional[_FramePipeline] = None
+        # With no bounds the loop runs at a fixed poll_ms period, measured start to start.
+        self.min_poll_ms = min_poll_ms if min_poll_ms is not None else poll_ms
+        self.max_poll_ms = max_poll_ms if max_poll_ms is not None else poll_ms
+        # 0 grabs every screen; N grabs monitor N; a region (left, top, width, height) wins over both.
+        self.capture_monitor = capture_monitor
+        self.capture_region = capture_region
+        # An explicit capture backend replaces the mss grab and its monitor/region.
+        self.capture = capture
+        # on_match runs on a sender thread; a template stays muted while its send
+        # is in flight (at most send_timeout seconds), then cools down by outcome.
+        self.max_pending_sends = max_pending_sends
+        self.send_timeout = send_timeout
+        self.timings_interval = timings_interval
         self._stop_signal = threading.Event()
         self._on_match = on_match
 
+    @property
+    def frames_scored(self) -> int:
+        if self._pipeline is not None:
+            return sum(engine.frames_scored for engine in self._pipeline.engines)
+        return self.detection.frames_scored
+
+    @property
+    def frames_skipped(self) -> int:
+        if self._pipeline is not None:
+            return sum(engine.frames_skipped for engine in self._pipeline.engines)
+        return self.detection.frames_skipped
+
+    @property
+    def frames_dropped(self) -> int:
+        """Frames captured but never scored because the matchers were busy."""
+        return self._pipeline.ring.dropped if self._pipeline is not None else 0
+
+    def timings(self) -> Dict[str, Any]:
+        """Current per-stage latency percentiles, FPS and quality level; callable from any thread."""
+        snapshot = self.detection.timings.snapshot()
+        snapshot["quality"] = self.detection.quality
+        return snapshot
+
     def stop(self) -> None:
         self._stop_signal.set()
 
     def run(self) -> None:
+        engine = self.detection
+        timings = engine.timings
+        sender = _NotificationSender(self._on_match, self.max_pending_sends, timings, self._send_failed)
+        pipeline = None
+        if self.pipeline_consumers:
+            engines = [engine] + [DetectionEngine(self.templates, **self._engine_options) for _ in range(self.pipeline_consumers - 1)]
+            pipeline = _FramePipeline(engines, self, sender)
         try:
-            templ = _load_template(self.template_path)
+            for each in pipeline.engines if pipeline else [engine]:
+                each.open()
+                each.timings = timings
         except Exception as exc:
+            for each in pipeline.engines if pipeline else [engine]:
+                each.close()
             self.status.emit(f"Template error: {exc}")
             return
 
-        cooldown_until = 0.0
+        capture = self.capture or MssCapture(monitor=self.capture_monitor, region=self.capture_region)
+        poller = _AdaptivePoller(self.min_poll_ms, self.max_poll_ms)
+        scheduler = _DeadlineScheduler(self._stop_signal, timings)
+        controller = None
+        if self.cpu_budget and pipeline is None:
+            controller = _QualityController(engine, self.cpu_budget, self.max_poll_ms / 1000.0)
+        publisher = FramePublisher(self.publish_frames) if self.publish_frames else None
+        recorder = self.flight_recorder if pipeline is None else None
+        if recorder is not None:
+            recorder.start()
+        sender.start()
+        if pipeline is not None:
+            self._pipeline = pipeline
+            pipeline.start()
+        # With a pipeline, scoring and decisions happen on its threads; this loop only captures.
+        source = pipeline or engine
+        next_report = time.monotonic() + self.timings_interval
         self.status.emit("Detector running")
         while not self._stop_signal.is_set():
-            now = time.time()
             try:
-                if now >= cooldown_until:
-                    screen = _capture_screen_bgr()
-                    score = _template_score(screen, templ)
-                    if score >= self.threshold:
-                        self.match_detected.emit(score)
-                        success = False
+                if pipeline is None:
+                    for state, delivered, finished_at in sender.completed():
+                        engine.cool_down(state, finished_at, self.debounce_seconds, delivered)
+                now = time.time()
+                changed = False
+                active = source.active(now)
+                if active:
+                    start = time.perf_counter()
+                    busy = time.process_time()
+                    raw = capture.grab_raw()
+                    if publisher is not None:
                         try:
-                            success = self._on_match()
+                            publisher.publish(raw)
                         except Exception as exc:
-                            self.status.emit(f"Send error: {exc}")
-                        cooldown = self.debounce_seconds if success else 3
-                        cooldown_until = time.time() + max(1, cooldown)
-                time.sleep(max(0.01, self.poll_ms / 1000.0))
+                            # Sharing is a side channel; never let it stop detection.
+                            self.status.emit(f"Frame sharing disabled: {exc}")
+                            failed, publisher = publisher, None
+                            failed.close()
+                    timings.record("capture", time.perf_counter() - start)
+                    timings.frame()
+                    if pipeline is not None:
+                        pipeline.ring.publish(raw)
+                        changed = pipeline.changed
+                    else:
+                        changed = engine.score(raw, active)
+                        if controller is not None:
+                            controller.record(time.process_time() - busy)
+                        if recorder is not None:
+                            self._record(recorder, engine.last_frame, active)
+                        for state in engine.hits(active):
+                            self._fire(state, sender, now)
+                closest = source.closest()
+                if time.monotonic() >= next_report:
+                    next_report = time.monotonic() + self.timings_interval
+                    self.timings_updated.emit(self.timings())
+                period = poller.next_delay(changed, closest.score, closest.spec.threshold)
+                if controller is not None:
+                    period = max(period, controller.update(time.time(), closest.score, closest.spec.threshold))
+                start = time.perf_counter()
+                scheduler.wait(max(0.01, period))
+                timings.record("sleep", time.perf_counter() - start)
+            except EOFError as exc:
+                self.status.emit(f"Capture finished: {exc}")
+                break
             except Exception as exc:
                 self.status.emit(f"Detector error: {exc}")
-                time.sleep(1)
+                capture.close()
+                engine.reset()
+                self._stop_signal.wait(1)
+                scheduler.restart()
+        if pipeline is not None:
+            pipeline.close()
+        sender.close()
+        capture.close()
+        if publisher is not None:
+            publisher.close()
+        if recorder is not None:
+            recorder.close()
+        for each in pipeline.engines if pipeline else [engine]:
+            each.close()
         self.status.emit("Detector stopped")
 
+    def _fire(self, state: "_TemplateState", sender: "_NotificationSender", now: float) -> None:
+        self.match_detected.emit(state.spec.name, state.score)
+        if sender.submit(state):
+            state.cooldown_until = now + self.send_timeout
+        else:
+            self.status.emit("Send queue full; notification dropped")
+            self.detection.cool_down(state, now, self.debounce_seconds, delivered=False)
+
+    def _record(self, recorder: FlightRecorder, frame: Optional["_Frame"], states: Sequence["_TemplateState"]) -> None:
+        if frame is not None:
+            recorder.add(frame, {state.spec.name: state.score for state in states})
+        for state in states:
+            if state.score >= state.spec.threshold:
+                recorder.trigger("match")
+            elif state.score >= state.spec.threshold - self.near_miss_margin:
+                recorder.trigger("near-miss")
+
+    def _send_failed(self, exc: Exception) -> None:
+        self.status.emit(f"Send error: {exc}")
+
+
+class _Verdict:
+    """The decision stage's view of one template: latest score and cooldown."""
+
+    def __init__(self, spec: TemplateSpec) -> None:
+        self.spec = spec
+        self.score = 0.0
+        self.cooldown_until = 0.0
+
+
+class _FrameRing:
+    """Fixed set of preallocated frame buffers between the capture thread and the matchers.
+
+    ``publish`` copies a grab into a free slot and makes it the newest frame;
+    ``take`` hands it to one consumer. A frame nobody took before the next one
+    arrived is dropped, so slow matchers skip frames instead of queueing them.
+    With one slot per consumer plus two, ``publish`` always finds a free slot.
+    """
+
+    def __init__(self, slots: int) -> None:
+        self._buffers: List[Optional[np.ndarray]] = [None] * slots
+        self._busy = [False] * slots
+        self._ready: Optional[Tuple[int, int]] = None  # (sequence, slot) of the newest untaken frame
+        self._cond = threading.Condition()
+        self._sequence = 0
+        self._closed = False
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, raw: np.ndarray) -> None:
+        with self._cond:
+            slot = next(index for index, busy in enumerate(self._busy) if not busy)
+            self._busy[slot] = True
+        buffer = self._buffers[slot]
+        if buffer is None or buffer.shape != raw.shape:
+            buffer = self._buffers[slot] = np.empty_like(raw)
+        np.copyto(buffer, raw)
+        with self._cond:
+            if self._ready is not None:
+                self._busy[self._ready[1]] = False
+                self.dropped += 1
+            self._sequence += 1
+            self._ready = (self._sequence, slot)
+            self.published += 1
+            self._cond.notify()
+
+    def take(self) -> Optional[Tuple[int, int, np.ndarray]]:
+        """Block for the newest frame: ``(sequence, slot, frame)``, or None once closed."""
+        with self._cond:
+            while self._ready is None and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            sequence, slot = self._ready
+            self._ready = None
+            return sequence, slot, self._buffers[slot]
+
+    def release(self, slot: int) -> None:
+        with self._cond:
+            self._busy[slot] = False
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class _FramePipeline:
+    """Matcher and decision threads behind the capture loop of a ``DetectorThread``.
+
+    Each consumer owns one ``DetectionEngine`` (engines are not thread-safe) and
+    scores frames taken from the ring. Their scores go to a single decision
+    thread, which ignores results older than the newest it has seen, applies
+    threshold and cooldown, and fires through the detector's notification sender.
+    ``active`` and ``closest`` mirror ``DetectionEngine`` for the capture loop.
+    """
+
+    def __init__(self, engines: Sequence[DetectionEngine], detector: "DetectorThread", sender: "_NotificationSender") -> None:
+        self.engines = list(engines)
+        self.detector = detector
+        self.sender = sender
+        self.ring = _FrameRing(len(self.engines) + 2)
+        self.verdicts = [_Verdict(spec) for spec in detector.templates]
+        self.changed = False
+        self._results: "queue.SimpleQueue[Optional[Tuple[int, Dict[str, float], bool]]]" = queue.SimpleQueue()
+        self._threads: List[threading.Thread] = []
+        self._decided = 0
+
+    def start(self) -> None:
+        for index, engine in enumerate(self.engines):
+            self._threads.append(threading.Thread(target=self._consume, args=(engine,), name=f"omnicall-match-{index}", daemon=True))
+        self._threads.append(threading.Thread(target=self._decide, name="omnicall-decide", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def close(self) -> None:
+        self.ring.close()
+        self._results.put(None)
+        for thread in self._threads:
+            thread.join(2.0)
+        self._threads = []
 
-def _load_template(path: str) -> np.ndarray:
+    def active(self, now: float) -> List[_Verdict]:
+        return [verdict for verdict in self.verdicts if now >= verdict.cooldown_until]
+
+    def closest(self) -> _Verdict:
+        return max(self.verdicts, key=lambda verdict: verdict.score - verdict.spec.threshold)
+
+    def _consume(self, engine: DetectionEngine) -> None:
+        while True:
+            taken = self.ring.take()
+            if taken is None:
+                return
+            sequence, slot, frame = taken
+            try:
+                active = {verdict.spec.name for verdict in self.active(time.time())}
+                states = [state for state in engine.states if state.spec.name in active]
+                changed = engine.score(frame, states) if states else False
+                self._results.put((sequence, {state.spec.name: state.score for state in states}, changed))
+            except Exception as exc:
+                self.detector.status.emit(f"Detector error: {exc}")
+                engine.reset()
+            finally:
+                self.ring.release(slot)
+
+    def _decide(self) -> None:
+        by_name = {verdict.spec.name: verdict for verdict in self.verdicts}
+        while True:
+            for verdict, delivered, finished_at in self.sender.completed():
+                DetectionEngine.cool_down(verdict, finished_at, self.detector.debounce_seconds, delivered)
+            try:
+                result = self._results.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if result is None:
+                return
+            sequence, scores, changed = result
+            if sequence <= self._decided:
+                continue  # a newer frame was already decided
+            self._decided = sequence
+            self.changed = changed
+            now = time.time()
+            scored = []
+            for name, score in scores.items():
+                verdict = by_name[name]
+                verdict.score = score
+                if now >= verdict.cooldown_until:
+                    scored.append(verdict)
+            for verdict in DetectionEngine.hits(scored):
+                self.detector._fire(verdict, self.sender, now)
+
+
+class _NotificationSender:
+    """Runs ``on_match`` on its own thread so a slow send never stalls capture.
+
+    Up to ``max_pending`` requests queue; beyond that ``submit`` refuses. The
+    detector loop collects ``(state, delivered, finished_at)`` outcomes with
+    ``completed`` and sets cooldowns from them.
+    """
+
+    def __init__(
+        self,
+        on_match: Callable[[str], bool],
+        max_pending: int = 4,
+        timings: Optional[StageTimings] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ) -> None:
+        self.on_match = on_match
+        self.timings = timings
+        self.on_error = on_error
+        self._requests: "queue.Queue[Optional[_TemplateState]]" = queue.Queue(max(1, max_pending))
+        self._outcomes: "queue.SimpleQueue[Tuple[_TemplateState, bool, float]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="omnicall-send", daemon=True)
+        self._thread.start()
+
+    def submit(self, state: "_TemplateState") -> bool:
+        try:
+            self._requests.put_nowait(state)
+        except queue.Full:
+            return False
+        return True
+
+    def completed(self) -> List[Tuple["_TemplateState", bool, float]]:
+        outcomes = []
+        while True:
+            try:
+                outcomes.append(self._outcomes.get_nowait())
+            except queue.Empty:
+                return outcomes
+
+    def close(self, timeout: float = 0.2) -> None:
+        """Stop after the send in flight; queued requests are dropped. Does not wait out a slow send."""
+        if self._thread is None:
+            return
+        while True:
+            try:
+                self._requests.get_nowait()
+            except queue.Empty:
+                break
+        self._requests.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            state = self._requests.get()
+            if state is None:
+                return
+            start = time.perf_counter()
+            delivered = False
+            try:
+                delivered = bool(self.on_match(state.spec.name))
+            except Exception as exc:
+                if self.on_error is not None:
+                    self.on_error(exc)
+            if self.timings is not None:
+                self.timings.record("notify", time.perf_counter() - start)
+            self._outcomes.put((state, delivered, time.time()))
+
+
+class FlightRecorder:
+    """Keeps the last ``seconds`` of frames, downscaled and JPEG-compressed, with their scores.
+
+    ``add`` takes scored frames only (a static screen adds nothing). It copies
+    the frame's ``raw_downsampled`` image, which the pyramid engine has usually
+    made already, and queues it, or drops the frame without resizing anything if
+    the queue is full; compression, eviction and writing to disk happen on the
+    recorder's own thread. Compressed frames are capped at ``max_bytes`` in
+    total. ``dump`` writes the buffer to ``directory/<time>-<reason>/`` as
+    numbered JPEGs plus ``scores.json`` and then deletes the oldest dumps beyond
+    ``max_dumps``; ``trigger`` does the same but at most once per
+    ``min_dump_interval``.
+    Neither ``dump`` nor ``close`` waits on that thread: a dump is left for it
+    to pick up (a newer one replaces one not yet started, counted in
+    ``dumps_dropped``), and a closed recorder's thread exits once idle.
+    """
+
+    def __init__(
+        self,
+        seconds: float = 10.0,
+        max_bytes: int = 16 * 1024 * 1024,
+        scale: float = 0.25,
+        jpeg_quality: int = 70,
+        directory: Path = APP_DIR / "recordings",
+        min_dump_interval: float = 30.0,
+        max_dumps: int = 20,
+    ) -> None:
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.scale = scale
+        self.jpeg_quality = jpeg_quality
+        self.directory = directory
+        self.min_dump_interval = min_dump_interval
+        self.max_dumps = max_dumps
+        self.nbytes = 0
+        self.dropped = 0
+        self.dumps_dropped = 0
+        self._frames: Deque[Tuple[float, Dict[str, float], bytes]] = deque()
+        self._queue: "queue.Queue[Tuple[float, Dict[str, float], np.ndarray]]" = queue.Queue(8)
+        self._pending: Optional[Path] = None
+        self._lock = threading.Lock()
+        self._next_trigger = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop: Optional[threading.Event] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="omnicall-recorder", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread = None
+
+    def add(self, frame: "_Frame", scores: Dict[str, float], timestamp: Optional[float] = None) -> None:
+        if self._queue.full():
+            self.dropped += 1
+            return
+        # Copied: the downsample lives in the engine's buffer pool and is reused next frame.
+        small = frame.raw_downsampled(self.scale).copy()
+        try:
+            self._queue.put_nowait((timestamp or time.time(), dict(scores), small))
+        except queue.Full:
+            self.dropped += 1
+
+    def dump(self, reason: str = "manual") -> Path:
+        """Dump everything buffered so far; returns the directory it will be written to."""
+        target = self.directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{reason}"
+        if self._thread is None:
+            # Not recording (detector stopped): nothing else is writing, do it from here.
+            try:
+                self._write(target)
+            except OSError:
+                pass
+            return target
+        with self._lock:
+            if self._pending is not None:
+                self.dumps_dropped += 1
+            self._pending = target
+        return target
+
+    def trigger(self, reason: str) -> Optional[Path]:
+        now = time.monotonic()
+        if now < self._next_trigger:
+            return None
+        self._next_trigger = now + self.min_dump_interval
+        return self.dump(reason)
+
+    def _run(self, stop: threading.Event) -> None:
+        while True:
+            with self._lock:
+                target, self._pending = self._pending, None
+            if target is not None:
+                try:
+                    self._write(target)
+                except OSError:
+                    pass  # best effort, like the scale cache
+            try:
+                timestamp, scores, image = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set() and self._pending is None:
+                    return
+                continue
+            if image.ndim == 3 and image.shape[2] == 4:
+                image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+            ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                self._frames.append((timestamp, scores, encoded.tobytes()))
+                self.nbytes += len(self._frames[-1][2])
+                self._evict(timestamp)
+
+    def _evict(self, now: float) -> None:
+        while self._frames and (self.nbytes > self.max_bytes or now - self._frames[0][0] > self.seconds):
+            self.nbytes -= len(self._frames.popleft()[2])
+
+    def _write(self, target: Path) -> None:
+        target.mkdir(parents=True, exist_ok=True)
+        index = []
+        for number, (timestamp, scores, data) in enumerate(list(self._frames)):
+            name = f"frame_{number:04d}.jpg"
+            (target / name).write_bytes(data)
+            index.append({"file": name, "time": timestamp, "scores": scores})
+        (target / "scores.json").write_text(json.dumps(index, indent=2), encoding="utf-8")
+        self._prune()
+
+    def _prune(self) -> None:
+        dumps = sorted(path for path in self.directory.iterdir() if (path / "scores.json").is_file())
+        for old in dumps[: max(0, len(dumps) - self.max_dumps)]:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+class ReplaySource:
+    """Recorded frames from a directory of screenshots or a video file, in order.
+
+    Yields ``(label, timestamp, frame)``. Screenshots are spaced ``1 / fps`` seconds
+    apart; video frames use the container's timestamps, falling back to ``fps``.
+    """
+
+    IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp")
+
+    def __init__(self, path: str, fps: float = 4.0) -> None:
+        self.path = Path(path).expanduser()
+        self.fps = fps
+        if not self.path.exists():
+            raise FileNotFoundError(f"Replay source not found: {self.path}")
+
+    def __iter__(self) -> Iterator[Tuple[str, float, np.ndarray]]:
+        if self.path.is_dir():
+            return self._images()
+        return self._video()
+
+    def _images(self) -> Iterator[Tuple[str, float, np.ndarray]]:
+        files = sorted(p for p in self.path.iterdir() if p.suffix.lower() in self.IMAGE_SUFFIXES)
+        for index, file in enumerate(files):
+            image = cv2.imread(str(file), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            yield file.name, index / self.fps, image
+
+    def _video(self) -> Iterator[Tuple[str, float, np.ndarray]]:
+        video = cv2.VideoCapture(str(self.path))
+        if not video.isOpened():
+            raise ValueError(f"Cannot open video: {self.path}")
+        try:
+            index = 0
+            while True:
+                ok, image = video.read()
+                if not ok:
+                    break
+                msec = video.get(cv2.CAP_PROP_POS_MSEC)
+                timestamp = msec / 1000.0 if msec > 0 or index == 0 else index / self.fps
+                yield f"frame {index}", timestamp, image
+                index += 1
+        finally:
+            video.release()
+
+
+def replay(source: ReplaySource, detection: DetectionEngine, debounce_seconds: float) -> Iterator[Dict[str, Any]]:
+    """Run ``detection`` over recorded frames as fast as they decode.
+
+    Uses the same cooldown and threshold decisions as ``DetectorThread.run`` on
+    the recording's own clock, with every notification treated as delivered.
+    Scale calibration advances per scored frame, not on the wall clock, so the
+    results do not depend on how fast the machine replays.
+    Yields one record per frame: label, timestamp, scores by template name (None
+    while cooling down) and the names that would have notified.
+    """
+    detection.open()
+    try:
+        for label, now, frame in source:
+            active = detection.active(now)
+            matched: List[str] = []
+            if active:
+                detection.score(frame, active)
+                for state in detection.hits(active):
+                    detection.cool_down(state, now, debounce_seconds, delivered=True)
+                    matched.append(state.spec.name)
+            yield {
+                "frame": label,
+                "time": now,
+                # Templates still cooling down were not scored this frame.
+                "scores": {state.spec.name: state.score if state in active else None for state in detection.states},
+                "matches": matched,
+            }
+    finally:
+        detection.close()
+
+
+class _TemplateState:
+    """Per-template matcher, ROI, cooldown and display scale inside one detector run.
+
+    With a scale cache the template is calibrated once per screen geometry: a
+    cached scale is reused if present, otherwise a ``_ScaleSearch`` advances one
+    step on each scored frame until the template is found.
+    """
+
+    def __init__(
+        self,
+        spec: TemplateSpec,
+        source: np.ndarray,
+        color_mode: str,
+        matcher: Matcher,
+        roi: Optional["_RoiTracker"],
+        cache: Optional["_ScaleCache"] = None,
+    ) -> None:
+        self.spec = spec
+        self.source = source
+        self.color_mode = color_mode
+        self.templ = _prepare_template(source, color_mode)
+        self.matcher = matcher
+        self.roi = roi
+        self.cache = cache
+        self.scale = 1.0
+        self.score = 0.0
+        # _FrameGate.generation of the frame ``score`` came from; -1 = never scored.
+        self.generation = -1
+        self.cooldown_until = 0.0
+        self._hash = hashlib.sha1(source.tobytes()).hexdigest()[:16]
+        self._geometry: Optional[Tuple[int, int]] = None
+        self._calibrated = False
+        self._search: Optional[_ScaleSearch] = None
+
+    def match(self, frame: "_Frame") -> float:
+        if self.cache is not None:
+            self._calibrate(frame)
+        if self.roi is not None:
+            score = self.roi.match(frame, self.templ, self.spec.threshold)[0]
+        else:
+            score = self.matcher(frame, self.templ)[0]
+        if self.cache is not None and not self._calibrated and score >= self.spec.threshold:
+            self._apply_scale(self.scale, store=True)
+        return score
+
+    def _calibrate(self, frame: "_Frame") -> None:
+        geometry = (frame.shape[1], frame.shape[0])
+        if geometry != self._geometry:
+            self._geometry = geometry
+            self._calibrated = False
+            self._search = None
+            cached = self.cache.load(self._cache_key())
+            if cached is not None:
+                self._use_template(*cached)
+        if self._calibrated:
+            return
+        if self._search is None or self._search.color_mode != self.color_mode:
+            self._search = _ScaleSearch(self.source, self.color_mode, self.spec.threshold)
+        found = self._search.step(frame)
+        if found is not None:
+            self._apply_scale(found, store=True)
+
+    def set_color_mode(self, color_mode: str) -> None:
+        if color_mode == self.color_mode:
+            return
+        self.color_mode = color_mode
+        self.templ = _prepare_template(_rescale_template(self.source, self.scale), color_mode)
+
+    def _apply_scale(self, scale: float, store: bool) -> None:
+        scaled = _rescale_template(self.source, scale)
+        if store:
+            self.cache.store(self._cache_key(), scale, scaled)
+        self._use_template(scale, scaled)
+
+    def _use_template(self, scale: float, scaled: np.ndarray) -> None:
+        self.scale = scale
+        self.templ = _prepare_template(scaled, self.color_mode)
+        self._calibrated = True
+        if self.roi is not None:
+            self.roi.roi = None
+
+    def _cache_key(self) -> str:
+        width, height = self._geometry or (0, 0)
+        return f"{self._hash}-{width}x{height}"
+
+
+# The Accept button's dark teal fill, measured on Accept.png at quarter size.
+ACCEPT_BUTTON_PREFILTER = ColorPrefilter(lower=(60, 50, 35), upper=(95, 200, 170))
+
+# Rungs of the CPU-budget ladder, dearest first. Each applies on top of the
+# configured setup and never makes it more expensive: single-channel matching,
+# the coarse-to-fine engine, then a coarser pyramid with rarer full scans while
+# the ROI tracker holds a lock.
+QUALITY_LEVELS: Tuple[Dict[str, Any], ...] = (
+    {},
+    {"color_mode": "gray"},
+    {"color_mode": "gray", "engine": "pyramid"},
+    {"color_mode": "gray", "engine": "pyramid", "coarse": 0.15, "full_scan_factor": 3},
+)
+
+# "bgr" correlates all three channels; "gray" (luminance) and "green" (the
+# channel carrying most of the Accept button's signal) match on one channel.
+COLOR_MODES = ("bgr", "gray", "green")
+
+# Candidate template scales for the calibration search (Windows 100%-200% scaling,
+# plus downscaled UIs on small or windowed displays).
+SCALE_STEPS = (0.5, 0.625, 0.75, 0.8, 0.9, 1.0, 1.1, 1.25, 1.5, 1.75, 2.0)
+
+
+def _read_template(path: str) -> np.ndarray:
     resolved = Path(path).expanduser().resolve()
     templ = cv2.imread(str(resolved), cv2.IMREAD_COLOR)
     if templ is None:
@@ -66,16 +1127,1210 @@ def _load_template(path: str) -> np.ndarray:
     return templ
 
 
-def _capture_screen_bgr() -> np.ndarray:
+def _prepare_template(templ: np.ndarray, color_mode: str) -> np.ndarray:
+    if color_mode == "gray":
+        return cv2.cvtColor(templ, cv2.COLOR_BGR2GRAY)
+    if color_mode == "green":
+        return cv2.extractChannel(templ, 1)
+    return templ
+
+
+def _load_template(path: str, color_mode: str = "bgr") -> np.ndarray:
+    return _prepare_template(_read_template(path), color_mode)
+
+
+def _rescale_template(templ: np.ndarray, scale: float) -> np.ndarray:
+    if scale == 1.0:
+        return templ
+    height, width = templ.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    return cv2.resize(templ, size, interpolation=interpolation)
+
+
+class _ScaleSearch:
+    """Finds the template scale for this display, a little on each frame.
+
+    A sweep ranks each of ``SCALE_STEPS`` on a ``coarse`` downsample of the
+    screen, then confirms the best ``verify`` scales at full resolution. Every
+    ``step`` does one of those matches, so the search never costs a frame more
+    than one coarse or one pyramid match; a sweep that confirms nothing starts
+    over on the next frame.
+    """
+
+    def __init__(self, source: np.ndarray, color_mode: str, threshold: float, coarse: float = 0.25, verify: int = 2) -> None:
+        self.source = source
+        self.color_mode = color_mode
+        self.threshold = threshold
+        self.coarse = coarse
+        self.verify = verify
+        self._ranked: List[Tuple[Optional[float], float]] = []
+        self._candidates: Optional[List[float]] = None
+
+    def step(self, frame: "_Frame") -> Optional[float]:
+        """Advance the search on ``frame``; returns the scale once one is confirmed."""
+        if self._candidates is None:
+            scale = SCALE_STEPS[len(self._ranked)]
+            self._ranked.append((self._rank(frame, scale), scale))
+            if len(self._ranked) == len(SCALE_STEPS):
+                ranked = sorted((item for item in self._ranked if item[0] is not None), reverse=True)
+                self._candidates = [scale for _coarse_score, scale in ranked[: self.verify]]
+                self._ranked = []
+            return None
+        if not self._candidates:
+            self._candidates = None
+            return None
+        scale = self._candidates.pop(0)
+        templ = _prepare_template(_rescale_template(self.source, scale), self.color_mode)
+        if _PyramidMatcher(scale=self.coarse)(frame, templ)[0] >= self.threshold:
+            return scale
+        if not self._candidates:
+            self._candidates = None
+        return None
+
+    def _rank(self, frame: "_Frame", scale: float) -> Optional[float]:
+        small_screen = frame.downsampled(self.coarse)
+        small_templ = _prepare_template(_rescale_template(self.source, scale * self.coarse), self.color_mode)
+        th, tw = small_templ.shape[:2]
+        if min(th, tw) < _PyramidMatcher.MIN_COARSE_SIZE or th > small_screen.shape[0] or tw > small_screen.shape[1]:
+            return None
+        res = cv2.matchTemplate(small_screen, small_templ, cv2.TM_CCOEFF_NORMED)
+        return cv2.minMaxLoc(res)[1]
+
+
+class _ScaleCache:
+    """Calibrated template scales, persisted next to config.json.
+
+    The index maps ``<template hash>-<width>x<height>`` to a scale, and the
+    rescaled template is written alongside it as a PNG.
+    """
+
+    def __init__(self, directory: Path = APP_DIR) -> None:
+        self.index_path = directory / "template_scales.json"
+        self.image_dir = directory / "templates"
+
+    def load(self, key: str) -> Optional[Tuple[float, np.ndarray]]:
+        entry = self._read_index().get(key)
+        if not isinstance(entry, dict):
+            return None
+        templ = cv2.imread(str(self.image_dir / f"{key}.png"), cv2.IMREAD_COLOR)
+        try:
+            scale = float(entry["scale"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return (scale, templ) if templ is not None else None
+
+    def store(self, key: str, scale: float, templ: np.ndarray) -> None:
+        try:
+            self.image_dir.mkdir(parents=True, exist_ok=True)
+            cv2.imwrite(str(self.image_dir / f"{key}.png"), templ)
+            index = self._read_index()
+            index[key] = {"scale": scale}
+            with self.index_path.open("w", encoding="utf-8") as f:
+                json.dump(index, f, indent=2)
+        except Exception:
+            pass
+
+    def _read_index(self) -> Dict[str, dict]:
+        if not self.index_path.exists():
+            return {}
+        try:
+            with self.index_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+
+def _converted_shape(shape: Tuple[int, ...], color_mode: str) -> Tuple[int, ...]:
+    return shape[:2] + (3,) if color_mode == "bgr" else shape[:2]
+
+
+def _convert_frame(raw: np.ndarray, color_mode: str, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """Convert a BGRA (or BGR) image to the matching representation, writing into ``dst`` if it fits."""
+    shape = _converted_shape(raw.shape, color_mode)
+    if dst is None or dst.shape != shape:
+        dst = np.empty(shape, dtype=np.uint8)
+    bgra = raw.shape[2] == 4
+    if color_mode == "gray":
+        return cv2.cvtColor(raw, cv2.COLOR_BGRA2GRAY if bgra else cv2.COLOR_BGR2GRAY, dst=dst)
+    if color_mode == "green":
+        return cv2.extractChannel(raw, 1, dst=dst)
+    if bgra:
+        return cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR, dst=dst)
+    np.copyto(dst, raw)
+    return dst
+
+
+class _BufferPool:
+    """Per-frame intermediates reused across frames instead of reallocated.
+
+    Buffers are keyed by purpose and shape and live until the frame geometry
+    changes. ``allocations`` only grows while the pool warms up, so a steady
+    value during tracking means the hot path is allocation-free.
+    """
+
+    def __init__(self) -> None:
+        self._buffers: Dict[tuple, np.ndarray] = {}
+        self._geometry: Optional[Tuple[int, int]] = None
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def bind(self, geometry: Tuple[int, int]) -> None:
+        if geometry != self._geometry:
+            self._buffers.clear()
+            self._geometry = geometry
+
+    def get(self, key: str, shape: Tuple[int, ...], dtype: type = np.uint8, exact: bool = True) -> np.ndarray:
+        """Return a ``shape`` array for ``key``. With ``exact=False`` a larger buffer is
+        kept and a (row-strided) view of it is returned, for sizes that vary per call."""
+        slot = (key, np.dtype(dtype).str, shape if exact else len(shape))
+        buf = self._buffers.get(slot)
+        if buf is None or any(have < need for have, need in zip(buf.shape, shape)):
+            alloc_shape = shape if buf is None else tuple(max(have, need) for have, need in zip(buf.shape, shape))
+            buf = self._buffers[slot] = np.empty(alloc_shape, dtype=dtype)
+            self.allocations += 1
+            self.allocated_bytes += buf.nbytes
+        return buf[tuple(slice(0, n) for n in shape)]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buf.nbytes for buf in self._buffers.values())
+
+
+class _Frame:
+    """One captured image, handed to the matchers without converting it up front.
+
+    ``raw`` is the BGRA grab (a zero-copy view of the capture buffer) or a BGR
+    image. Matchers ask for the converted full frame, a converted window or a
+    downsample; each is produced on demand into a buffer from ``pool``, which
+    outlives the frame.
+    """
+
+    def __init__(self, raw: np.ndarray, color_mode: str, pool: Optional[_BufferPool] = None) -> None:
+        self.raw = raw
+        self.color_mode = color_mode
+        self.shape: Tuple[int, int] = raw.shape[:2]
+        self.pool = pool if pool is not None else _BufferPool()
+        self.pool.bind(self.shape)
+        self._full: Optional[np.ndarray] = None
+        self._small: Dict[float, np.ndarray] = {}
+        self._raw_small: Dict[float, np.ndarray] = {}
+        # Time spent converting and resizing, summed over every thread that asked.
+        self.convert_seconds = 0.0
+
+    def full(self) -> np.ndarray:
+        if self._full is None:
+            start = time.perf_counter()
+            self._full = _convert_frame(self.raw, self.color_mode, self.pool.get("full", _converted_shape(self.raw.shape, self.color_mode)))
+            self.convert_seconds += time.perf_counter() - start
+        return self._full
+
+    def window(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        if self._full is not None:
+            return self._full[y0:y1, x0:x1]
+        start = time.perf_counter()
+        region = self.raw[y0:y1, x0:x1]
+        window = _convert_frame(region, self.color_mode, self.pool.get("window", _converted_shape(region.shape, self.color_mode), exact=False))
+        self.convert_seconds += time.perf_counter() - start
+        return window
+
+    def downsampled(self, scale: float) -> np.ndarray:
+        small = self._small.get(scale)
+        if small is None:
+            start = time.perf_counter()
+            height, width = self.shape
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            if self._full is not None and scale not in self._raw_small:
+                small = cv2.resize(self._full, size, dst=self.pool.get(f"full-resize@{scale}", (size[1], size[0]) + self._full.shape[2:]), interpolation=cv2.INTER_AREA)
+                self.convert_seconds += time.perf_counter() - start
+            else:
+                # Resizing the raw grab first means only the small image is converted.
+                resized = self.raw_downsampled(scale)
+                start = time.perf_counter()
+                small = _convert_frame(resized, self.color_mode, self.pool.get(f"small@{scale}", _converted_shape(resized.shape, self.color_mode)))
+                self.convert_seconds += time.perf_counter() - start
+            self._small[scale] = small
+        return small
+
+    def raw_downsampled(self, scale: float) -> np.ndarray:
+        """The grab itself (BGRA or BGR, unconverted) resized by ``scale``."""
+        small = self._raw_small.get(scale)
+        if small is None:
+            start = time.perf_counter()
+            height, width = self.shape
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            dst = self.pool.get(f"resize@{scale}", (size[1], size[0]) + self.raw.shape[2:])
+            small = self._raw_small[scale] = cv2.resize(self.raw, size, dst=dst, interpolation=cv2.INTER_AREA)
+            self.convert_seconds += time.perf_counter() - start
+        return small
+
+
+def list_monitors() -> List[dict]:
+    """mss monitor list: index 0 is the union of all screens, 1..N the individual ones."""
     with mss.mss() as sct:
-        monitor = sct.monitors[0]
-        raw = np.array(sct.grab(monitor))
-    return cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR)
+        return [dict(monitor) for monitor in sct.monitors]
+
+
+def _capture_area(monitors: Sequence[dict], monitor: int = 0, region: Optional[Sequence[int]] = None) -> dict:
+    """The rectangle to grab: ``region`` (left, top, width, height) clipped to the
+    desktop if given, else monitor ``monitor``, else all screens."""
+    desktop = monitors[0]
+    if region is not None:
+        left, top, width, height = (int(v) for v in region)
+        x0 = max(left, desktop["left"])
+        y0 = max(top, desktop["top"])
+        x1 = min(left + width, desktop["left"] + desktop["width"])
+        y1 = min(top + height, desktop["top"] + desktop["height"])
+        if x1 > x0 and y1 > y0:
+            return {"left": x0, "top": y0, "width": x1 - x0, "height": y1 - y0}
+    if 0 < monitor < len(monitors):
+        return dict(monitors[monitor])
+    return dict(desktop)
+
+
+class CaptureBackend(ABC):
+    """Where the detector's frames come from.
+
+    ``grab_raw`` returns one BGRA (or BGR) frame and opens the source on first
+    use; ``close`` releases it and may be followed by another grab, e.g. after a
+    capture error. All calls happen on the detector thread. A finite source
+    raises ``EOFError`` when it runs out.
+    """
+
+    name = "base"
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def grab_raw(self) -> np.ndarray:
+        """Return the next frame."""
+
+
+class MssCapture(CaptureBackend):
+    """Long-lived mss handle, owned by one detector thread.
+
+    mss handles are thread-bound on Windows, so the handle is created lazily on
+    the thread that grabs. It grabs one monitor or region (all screens by
+    default) and rebuilds itself when the monitor layout changes.
+    """
+
+    name = "mss"
+
+    def __init__(self, layout_check_seconds: float = 5.0, monitor: int = 0, region: Optional[Sequence[int]] = None) -> None:
+        self.layout_check_seconds = layout_check_seconds
+        self.monitor = monitor
+        self.region = tuple(region) if region is not None else None
+        self._sct = None
+        self._layout: Optional[List[dict]] = None
+        self._monitor: Optional[dict] = None
+        self._next_layout_check = 0.0
+
+    def open(self) -> None:
+        self.close()
+        self._sct = self._connect()
+        self._layout = [dict(monitor) for monitor in self._sct.monitors]
+        self._monitor = _capture_area(self._layout, self.monitor, self.region)
+        self._next_layout_check = time.monotonic() + self.layout_check_seconds
+
+    def close(self) -> None:
+        if self._sct is not None:
+            try:
+                self._sct.close()
+            except Exception:
+                pass
+        self._sct = None
+        self._layout = None
+        self._monitor = None
+
+    def grab_raw(self) -> np.ndarray:
+        """Return the BGRA grab as a NumPy view over the screenshot's own buffer (no copy)."""
+        if self._sct is None or self._layout_changed():
+            self.open()
+        shot = self._sct.grab(self._monitor)
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def _connect(self):
+        return mss.mss()
+
+    def _layout_changed(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_layout_check:
+            return False
+        self._next_layout_check = now + self.layout_check_seconds
+        # The open handle caches its monitor list, so probe with a throwaway one.
+        return list_monitors() != self._layout
+
+
+class XShmCapture(MssCapture):
+    """mss over X11 MIT-SHM: the X server writes grabs into shared memory.
+
+    Since mss 10.2 this is already how ``MssCapture`` grabs on Linux, and mss
+    quietly falls back to plain XGetImage where MIT-SHM does not work (remote X,
+    no extension). This class asks for it explicitly and reports what mss
+    actually did, from the notes it keeps (``backend_notes``): ``shared_memory``
+    is None until the first grab, then True if MIT-SHM is in use and False after
+    a fallback, on other platforms or with an older mss.
+    """
+
+    name = "xshm"
+
+    def __init__(self, layout_check_seconds: float = 5.0, monitor: int = 0, region: Optional[Sequence[int]] = None) -> None:
+        super().__init__(layout_check_seconds, monitor, region)
+        self.shared_memory: Optional[bool] = None
+        self.backend_notes: List[str] = []
+        self._requested = False
+
+    def open(self) -> None:
+        super().open()
+        self.shared_memory = None if self._requested else False
+
+    def grab_raw(self) -> np.ndarray:
+        frame = super().grab_raw()
+        if self.shared_memory is None:
+            self.backend_notes = list(self._sct.performance_status)
+            # mss notes every reason it fell back; the only other note is the one confirming MIT-SHM works.
+            fallbacks = [note for note in self.backend_notes if not note.startswith("MIT-SHM is working")]
+            self.shared_memory = bool(self.backend_notes) and not fallbacks
+        return frame
+
+    def _connect(self):
+        self._requested = False
+        if sys.platform.startswith("linux"):
+            try:
+                sct = mss.mss(backend="xshmgetimage")
+            except TypeError:
+                pass
+            else:
+                self._requested = True
+                return sct
+        return mss.mss()
+
+
+class SyntheticCapture(CaptureBackend):
+    """Cycles through fixed frames, for tests and benchmarks without a display.
+
+    With no ``frames`` it serves a single blurred-noise screen of ``size``.
+    """
+
+    name = "synthetic"
+
+    def __init__(self, frames: Optional[Sequence[np.ndarray]] = None, size: Tuple[int, int] = (1920, 1080), seed: int = 0) -> None:
+        if not frames:
+            width, height = size
+            noise = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+            frames = [cv2.cvtColor(cv2.GaussianBlur(noise, (9, 9), 0), cv2.COLOR_BGR2BGRA)]
+        self.frames = list(frames)
+        self.grabs = 0
+
+    def grab_raw(self) -> np.ndarray:
+        frame = self.frames[self.grabs % len(self.frames)]
+        self.grabs += 1
+        return frame
+
+
+class ReplayCapture(CaptureBackend):
+    """Serves a recording (see ``ReplaySource``) frame by frame at the detector's poll rate.
+
+    Restarts from the top when ``loop`` is set; otherwise raises ``EOFError`` at the end.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, fps: float = 4.0, loop: bool = False) -> None:
+        self.source = ReplaySource(path, fps)
+        self.loop = loop
+        self._frames: Optional[Iterator[Tuple[str, float, np.ndarray]]] = None
+
+    def open(self) -> None:
+        self._frames = iter(self.source)
+
+    def grab_raw(self) -> np.ndarray:
+        if self._frames is None:
+            self.open()
+        for _attempt in range(2):
+            try:
+                return next(self._frames)[2]
+            except StopIteration:
+                if not self.loop:
+                    break
+                self.open()
+        raise EOFError(f"Replay finished: {self.source.path}")
+
+
+# Shared-memory frame ring: a header, one slot header per slot, then the slot
+# data at 64-byte aligned offsets.
+#   header:      magic, version, slot count, slot capacity (bytes), closed flag, latest sequence
+#   slot header: sequence (0 while being written), height, width, channels
+SHARED_FRAMES_NAME = "omnicall-frames"
+_RING_HEADER = struct.Struct("<4sIIQIQ")
+_SLOT_HEADER = struct.Struct("<QIII")
+_RING_MAGIC = b"OCFR"
+_RING_VERSION = 1
+
+
+def _ring_data_offset(slots: int) -> int:
+    end = _RING_HEADER.size + slots * _SLOT_HEADER.size
+    return (end + 63) // 64 * 64
+
+
+class FramePublisher:
+    """Publishes captured frames into a named shared-memory ring for other processes.
+
+    ``publish`` copies the frame into the next slot and then bumps the latest
+    sequence, so a reader never sees a half-written frame as the latest one.
+    Slots are sized for a BGRA grab of the whole desktop (or the first frame,
+    or ``capacity``, if bigger), so changing the capture area does not resize
+    the segment; a later frame that does not fit recreates it, bigger, and
+    readers notice and reattach. A segment of the same name that still exists
+    (left by a crashed publisher, or kept alive by a reader on Windows, where
+    unlinking is a no-op) is reused when it is big enough.
+    """
+
+    def __init__(self, name: str = SHARED_FRAMES_NAME, slots: int = 3, capacity: int = 0) -> None:
+        self.name = name
+        self.slots = max(2, slots)
+        self.capacity = capacity
+        self.sequence = 0
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+    def publish(self, raw: np.ndarray) -> int:
+        if self._shm is None or raw.nbytes > self.capacity:
+            self._create(max(self.capacity, raw.nbytes, _desktop_nbytes()))
+        self.sequence += 1
+        slot = self.sequence % self.slots
+        buf = self._shm.buf
+        header_at = _RING_HEADER.size + slot * _SLOT_HEADER.size
+        height, width = raw.shape[:2]
+        channels = raw.shape[2] if raw.ndim == 3 else 1
+        _SLOT_HEADER.pack_into(buf, header_at, 0, height, width, channels)
+        data_at = _ring_data_offset(self.slots) + slot * self.capacity
+        target = np.ndarray(raw.shape, np.uint8, buf, data_at)
+        np.copyto(target, raw)
+        _SLOT_HEADER.pack_into(buf, header_at, self.sequence, height, width, channels)
+        _RING_HEADER.pack_into(buf, 0, _RING_MAGIC, _RING_VERSION, self.slots, self.capacity, 0, self.sequence)
+        return self.sequence
+
+    def close(self) -> None:
+        if self._shm is None:
+            return
+        try:
+            _RING_HEADER.pack_into(self._shm.buf, 0, _RING_MAGIC, _RING_VERSION, self.slots, self.capacity, 1, self.sequence)
+        except (TypeError, ValueError):
+            pass
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+
+    def _create(self, capacity: int) -> None:
+        self.close()
+        self.capacity = (capacity + 63) // 64 * 64
+        size = _ring_data_offset(self.slots) + self.slots * self.capacity
+        try:
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            stale = _attach_shared_memory(self.name)
+            if stale.size >= size:
+                self._shm = stale
+            else:
+                stale.close()
+                stale.unlink()
+                self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        _RING_HEADER.pack_into(self._shm.buf, 0, _RING_MAGIC, _RING_VERSION, self.slots, self.capacity, 0, 0)
+
+
+class FrameReader:
+    """Reads the latest frame of a ``FramePublisher`` ring without copying it.
+
+    ``latest`` returns ``(sequence, frame)`` where ``frame`` is a view into
+    shared memory. It stays valid until the publisher wraps around to its slot,
+    ``slots - 1`` frames later; ``still_valid`` tells, or pass ``copy=True``.
+    """
+
+    def __init__(self, name: str = SHARED_FRAMES_NAME) -> None:
+        self.name = name
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+    def latest(self, copy: bool = False) -> Optional[Tuple[int, np.ndarray]]:
+        """The newest complete frame, or None if nothing is being published."""
+        for _attempt in range(3):
+            header = self._header()
+            if header is None:
+                return None
+            _magic, _version, slots, capacity, _closed, sequence = header
+            if sequence == 0:
+                return None
+            slot = sequence % slots
+            written, height, width, channels = _SLOT_HEADER.unpack_from(self._shm.buf, _RING_HEADER.size + slot * _SLOT_HEADER.size)
+            if written != sequence:
+                continue  # the publisher lapped us mid-read
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            frame = np.ndarray(shape, np.uint8, self._shm.buf, _ring_data_offset(slots) + slot * capacity)
+            if copy:
+                frame = frame.copy()
+                if not self.still_valid(sequence):
+                    continue
+            return sequence, frame
+        return None
+
+    def still_valid(self, sequence: int) -> bool:
+        header = self._header()
+        if header is None:
+            return False
+        slots = header[2]
+        written = _SLOT_HEADER.unpack_from(self._shm.buf, _RING_HEADER.size + (sequence % slots) * _SLOT_HEADER.size)[0]
+        return written == sequence
+
+    def close(self) -> None:
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                pass  # a caller still holds a frame view; the mapping goes with the process
+            self._shm = None
+
+    def _header(self) -> Optional[Tuple[Any, ...]]:
+        if self._shm is None:
+            try:
+                self._shm = _attach_shared_memory(self.name)
+            except FileNotFoundError:
+                return None
+        header = _RING_HEADER.unpack_from(self._shm.buf, 0)
+        if header[0] != _RING_MAGIC or header[1] != _RING_VERSION:
+            return None
+        if header[4]:
+            # The publisher closed or resized; drop this mapping and look again next time.
+            self.close()
+            return None
+        return header
+
+
+def _desktop_nbytes() -> int:
+    """Size of a BGRA grab of every screen, or 0 if the layout cannot be read."""
+    try:
+        desktop = list_monitors()[0]
+    except Exception:
+        return 0
+    return int(desktop["width"]) * int(desktop["height"]) * 4
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Open an existing segment without letting this process's resource tracker unlink it on exit."""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name)
+        if sys.platform != "win32":
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedFrameCapture(CaptureBackend):
+    """Takes frames another OmniCall process publishes instead of grabbing the screen again.
+
+    Frames are copied out of the ring: the publisher reuses a slot a couple of
+    frames later, which can be in the middle of a slow match.
+    """
+
+    name = "shared"
+
+    def __init__(self, name: str = SHARED_FRAMES_NAME) -> None:
+        self.reader = FrameReader(name)
+
+    def close(self) -> None:
+        self.reader.close()
+
+    def grab_raw(self) -> np.ndarray:
+        latest = self.reader.latest(copy=True)
+        if latest is None:
+            raise RuntimeError(f"No frames published on {self.reader.name}")
+        return latest[1]
 
 
 def _template_score(screen: np.ndarray, templ: np.ndarray) -> float:
+    return _template_match(screen, templ)[0]
+
+
+def _template_match(screen: np.ndarray, templ: np.ndarray, result: Optional[np.ndarray] = None) -> Match:
     if screen.shape[0] < templ.shape[0] or screen.shape[1] < templ.shape[1]:
-        return 0.0
-    res = cv2.matchTemplate(screen, templ, cv2.TM_CCOEFF_NORMED)
-    _min_val, max_val, _min_loc, _max_loc = cv2.minMaxLoc(res)
-    return float(max_val)
+        return 0.0, (0, 0)
+    res = cv2.matchTemplate(screen, templ, cv2.TM_CCOEFF_NORMED, result=result)
+    _min_val, max_val, _min_loc, max_loc = cv2.minMaxLoc(res)
+    return float(max_val), max_loc
+
+
+def _result_buffer(pool: "_BufferPool", key: str, screen_shape: Tuple[int, ...], templ_shape: Tuple[int, ...], exact: bool = True) -> Optional[np.ndarray]:
+    """Pooled ``TM_CCOEFF_NORMED`` output for a screen/template pair (None if the template does not fit)."""
+    rows, cols = screen_shape[0] - templ_shape[0] + 1, screen_shape[1] - templ_shape[1] + 1
+    if rows <= 0 or cols <= 0:
+        return None
+    return pool.get(key, (rows, cols), np.float32, exact=exact)
+
+
+class MatcherBackend(ABC):
+    """Computes the ``TM_CCOEFF_NORMED`` correlation map of a template over a frame.
+
+    ``result``, when given, is a preallocated float32 map to write into.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def correlate(self, screen: np.ndarray, templ: np.ndarray, result: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return the correlation map of ``templ`` over ``screen``."""
+
+    def match(self, screen: np.ndarray, templ: np.ndarray, result: Optional[np.ndarray] = None) -> Match:
+        if screen.shape[0] < templ.shape[0] or screen.shape[1] < templ.shape[1]:
+            return 0.0, (0, 0)
+        _min_val, max_val, _min_loc, max_loc = cv2.minMaxLoc(self.correlate(screen, templ, result))
+        return float(max_val), max_loc
+
+
+class OpenCvBackend(MatcherBackend):
+    name = "opencv"
+
+    def correlate(self, screen: np.ndarray, templ: np.ndarray, result: Optional[np.ndarray] = None) -> np.ndarray:
+        return cv2.matchTemplate(screen, templ, cv2.TM_CCOEFF_NORMED, result=result)
+
+
+class FftBackend(MatcherBackend):
+    """Normalized cross-correlation through the DFT, matching ``TM_CCOEFF_NORMED``.
+
+    The zero-mean template spectrum is computed once per padded frame size and
+    cached (the last ``MAX_SPECTRA`` sizes); each frame then costs one forward
+    and one inverse DFT per channel, independent of the template size. Window
+    variances come from integral images. Intermediates are pooled per thread
+    without exact shapes, so windows that change size every call (the colour
+    prefilter's) reuse one set of buffers. Safe to call from several threads at
+    once (the tiled engine does).
+    """
+
+    MAX_SPECTRA = 16
+
+    name = "fft"
+
+    def __init__(self) -> None:
+        self._templ: Optional[np.ndarray] = None
+        self._spectra: Dict[Tuple[int, int], Tuple[List[np.ndarray], float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def correlate(self, screen: np.ndarray, templ: np.ndarray, result: Optional[np.ndarray] = None) -> np.ndarray:
+        height, width = screen.shape[:2]
+        th, tw = templ.shape[:2]
+        rows, cols = height - th + 1, width - tw + 1
+        size = (cv2.getOptimalDFTSize(height), cv2.getOptimalDFTSize(width))
+        spectra, templ_norm = self._template_spectra(templ, size)
+        pool = getattr(self._local, "pool", None)
+        if pool is None:
+            pool = self._local.pool = _BufferPool()
+
+        padded = pool.get("padded", size, np.float32, exact=False)
+        padded[height:] = 0.0
+        padded[:height, width:] = 0.0
+        freq = pool.get("freq", size, np.float32, exact=False)
+        product = pool.get("product", size, np.float32, exact=False)
+        corr = pool.get("corr", size, np.float32, exact=False)
+        channel = pool.get("channel", (height, width), exact=False)
+        sums = pool.get("sums", (height + 1, width + 1), np.float64, exact=False)
+        squares = pool.get("squares", (height + 1, width + 1), np.float64, exact=False)
+        window_sum = pool.get("window_sum", (rows, cols), np.float64, exact=False)
+        window_sq = pool.get("window_sq", (rows, cols), np.float64, exact=False)
+        numerator = pool.get("numerator", (rows, cols), np.float32, exact=False)
+        variance = pool.get("variance", (rows, cols), np.float64, exact=False)
+        area = float(th * tw)
+        for index, spectrum in enumerate(spectra):
+            plane = cv2.extractChannel(screen, index, dst=channel) if screen.ndim == 3 else screen
+            np.copyto(padded[:height, :width], plane)
+            cv2.dft(padded, dst=freq, nonzeroRows=height)
+            cv2.mulSpectrums(freq, spectrum, 0, product, conjB=True)
+            cv2.idft(product, dst=corr, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE, nonzeroRows=rows)
+            cv2.integral2(plane, sum=sums, sqsum=squares, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+            _window_sums(sums, th, tw, window_sum)
+            _window_sums(squares, th, tw, window_sq)
+            # Per-channel window variance: sum(x^2) - sum(x)^2 / n.
+            np.multiply(window_sum, window_sum, out=window_sum)
+            np.divide(window_sum, area, out=window_sum)
+            np.subtract(window_sq, window_sum, out=window_sq)
+            if index == 0:
+                np.copyto(numerator, corr[:rows, :cols])
+                np.copyto(variance, window_sq)
+            else:
+                np.add(numerator, corr[:rows, :cols], out=numerator)
+                np.add(variance, window_sq, out=variance)
+
+        np.maximum(variance, 0.0, out=variance)
+        np.multiply(variance, templ_norm, out=variance)
+        np.sqrt(variance, out=variance)
+        # Flat windows score 0, as in cv2.matchTemplate.
+        flat = pool.get("flat", (rows, cols), np.bool_, exact=False)
+        np.less_equal(variance, 1e-6 * max(templ_norm, 1.0), out=flat)
+        np.copyto(variance, 1.0, where=flat)
+        if result is None or result.shape != (rows, cols):
+            result = np.empty((rows, cols), dtype=np.float32)
+        np.divide(numerator, variance, out=result, casting="unsafe")
+        np.copyto(result, 0.0, where=flat)
+        return np.clip(result, -1.0, 1.0, out=result)
+
+    def _template_spectra(self, templ: np.ndarray, size: Tuple[int, int]) -> Tuple[List[np.ndarray], float]:
+        with self._lock:
+            if self._templ is not templ:
+                self._templ = templ
+                self._spectra.clear()
+            cached = self._spectra.pop(size, None)
+            if cached is not None:
+                self._spectra[size] = cached  # most recently used last
+                return cached
+            while len(self._spectra) >= self.MAX_SPECTRA:
+                del self._spectra[next(iter(self._spectra))]
+            th, tw = templ.shape[:2]
+            spectra = []
+            templ_norm = 0.0
+            for channel in _split_channels(templ):
+                centered = channel.astype(np.float32) - float(channel.mean())
+                templ_norm += float((centered * centered).sum())
+                padded = np.zeros(size, dtype=np.float32)
+                padded[:th, :tw] = centered
+                spectra.append(cv2.dft(padded, nonzeroRows=th))
+            cached = self._spectra[size] = (spectra, templ_norm)
+            return cached
+
+
+class AutoBackend(MatcherBackend):
+    """Times every backend once per (frame size, template size) and keeps the fastest.
+
+    Sizes are bucketed to the next power of two on each side, so windows whose
+    size changes every call (the colour prefilter's) share a decision instead
+    of each starting, and keeping, a trial of its own.
+    """
+
+    name = "auto"
+
+    def __init__(self, candidates: Optional[Sequence[MatcherBackend]] = None) -> None:
+        self.candidates = list(candidates) if candidates else [OpenCvBackend(), FftBackend()]
+        self._choice: Dict[Tuple[Tuple[int, ...], Tuple[int, ...]], MatcherBackend] = {}
+        self._timings: Dict[Tuple[Tuple[int, ...], Tuple[int, ...]], List[Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def correlate(self, screen: np.ndarray, templ: np.ndarray, result: Optional[np.ndarray] = None) -> np.ndarray:
+        key = (_size_bucket(screen.shape), _size_bucket(templ.shape))
+        with self._lock:
+            chosen = self._choice.get(key)
+            trial = -1
+            if chosen is None:
+                timings = self._timings.setdefault(key, [])
+                if len(timings) < len(self.candidates):
+                    trial = len(timings)
+                    timings.append(None)
+        if chosen is not None:
+            return chosen.correlate(screen, templ, result)
+        if trial < 0:
+            # Every candidate is already being timed on another thread.
+            return self.candidates[0].correlate(screen, templ, result)
+        start = time.perf_counter()
+        res = self.candidates[trial].correlate(screen, templ, result)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            timings[trial] = elapsed
+            if None not in timings and len(timings) == len(self.candidates):
+                self._choice[key] = self.candidates[timings.index(min(timings))]
+                del self._timings[key]
+        return res
+
+    def selected(self, screen_shape: Tuple[int, ...], templ_shape: Tuple[int, ...]) -> Optional[str]:
+        chosen = self._choice.get((_size_bucket(screen_shape), _size_bucket(templ_shape)))
+        return chosen.name if chosen is not None else None
+
+
+def _size_bucket(shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    """``shape`` with height and width rounded up to powers of two (channels kept)."""
+    return tuple(1 << max(0, n - 1).bit_length() for n in shape[:2]) + tuple(shape[2:])
+
+
+BACKENDS: Dict[str, Callable[[], MatcherBackend]] = {
+    "opencv": OpenCvBackend,
+    "fft": FftBackend,
+    "auto": AutoBackend,
+}
+
+
+def _split_channels(image: np.ndarray) -> List[np.ndarray]:
+    return list(cv2.split(image)) if image.ndim == 3 else [image]
+
+
+def _window_sums(integral: np.ndarray, th: int, tw: int, out: np.ndarray) -> np.ndarray:
+    """Sum over every ``th`` x ``tw`` window from an integral image, written into ``out``."""
+    np.subtract(integral[th:, tw:], integral[:-th, tw:], out=out)
+    np.subtract(out, integral[th:, :-tw], out=out)
+    np.add(out, integral[:-th, :-tw], out=out)
+    return out
+
+
+class _PyramidMatcher:
+    """Coarse-to-fine matcher with the same score semantics as ``_template_match``.
+
+    Screen and template are downsampled by ``scale`` to find the strongest
+    ``candidates`` peaks cheaply; only small windows around those peaks are then
+    scored at full resolution with ``TM_CCOEFF_NORMED``.
+    """
+
+    MIN_COARSE_SIZE = 8
+
+    def __init__(self, scale: float = 0.25, candidates: int = 4, backend: Optional[MatcherBackend] = None) -> None:
+        self.scale = scale
+        self.candidates = max(1, candidates)
+        self.backend = backend or OpenCvBackend()
+        self._templ: Optional[np.ndarray] = None
+        self._templ_small: Optional[np.ndarray] = None
+
+    def __call__(self, frame: _Frame, templ: np.ndarray) -> Match:
+        small_templ = self._small_template(templ)
+        height, width = frame.shape
+        if small_templ is None or int(height * self.scale) < small_templ.shape[0] or int(width * self.scale) < small_templ.shape[1]:
+            return _template_match(frame.full(), templ, _result_buffer(frame.pool, "full", frame.shape, templ.shape))
+        small_screen = frame.downsampled(self.scale)
+        res = self.backend.correlate(small_screen, small_templ, _result_buffer(frame.pool, "pyramid", small_screen.shape, small_templ.shape))
+
+        th, tw = templ.shape[:2]
+        sth, stw = small_templ.shape[:2]
+        pad = int(math.ceil(1.0 / self.scale)) + 1
+        best: Match = (0.0, (0, 0))
+        for _ in range(self.candidates):
+            _min_val, peak, _min_loc, (cx, cy) = cv2.minMaxLoc(res)
+            if peak <= -1.0:
+                break
+            x0 = max(0, int(cx / self.scale) - pad)
+            y0 = max(0, int(cy / self.scale) - pad)
+            x1 = min(width, int(cx / self.scale) + tw + pad)
+            y1 = min(height, int(cy / self.scale) + th + pad)
+            window = frame.window(x0, y0, x1, y1)
+            score, (x, y) = _template_match(window, templ, _result_buffer(frame.pool, "verify", window.shape, templ.shape, exact=False))
+            if score > best[0]:
+                best = (score, (x + x0, y + y0))
+            # Suppress this peak so the next iteration finds a different candidate.
+            res[max(0, cy - sth // 2):cy + sth // 2 + 1, max(0, cx - stw // 2):cx + stw // 2 + 1] = -1.0
+        return best
+
+    def _small_template(self, templ: np.ndarray) -> Optional[np.ndarray]:
+        if self._templ is not templ:
+            self._templ = templ
+            th, tw = templ.shape[:2]
+            size = (int(tw * self.scale), int(th * self.scale))
+            if min(size) < self.MIN_COARSE_SIZE:
+                self._templ_small = None
+            else:
+                self._templ_small = cv2.resize(templ, size, interpolation=cv2.INTER_AREA)
+        return self._templ_small
+
+
+class _TiledMatcher:
+    """Scores overlapping tiles of the frame concurrently and merges the maxima.
+
+    Tiles overlap by the template size minus one, so every placement is scored
+    exactly once. OpenCV releases the GIL, so tiles run in parallel on the
+    ``pool`` threads. Once a tile reaches ``stop_at`` the pending tiles are
+    cancelled and that match is returned, after any tiles already running have
+    finished: they write into pooled buffers the next call reuses.
+    """
+
+    def __init__(self, backend: MatcherBackend, pool: ThreadPoolExecutor, workers: int, stop_at: Optional[float] = None, tiles_per_worker: int = 2) -> None:
+        self.backend = backend
+        self.pool = pool
+        self.stop_at = stop_at
+        self.tiles = max(1, workers * tiles_per_worker)
+
+    def __call__(self, frame: _Frame, templ: np.ndarray) -> Match:
+        screen = frame.full()
+        futures = {}
+        for index, (x0, y0, x1, y1) in enumerate(_tile_bounds(screen.shape, templ.shape, self.tiles)):
+            tile = screen[y0:y1, x0:x1]
+            result = _result_buffer(frame.pool, f"tile{index}", tile.shape, templ.shape)
+            futures[self.pool.submit(self.backend.match, tile, templ, result)] = (x0, y0)
+        best: Match = (0.0, (0, 0))
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                score, (x, y) = future.result()
+                x0, y0 = futures[future]
+                if score > best[0]:
+                    best = (score, (x + x0, y + y0))
+            if self.stop_at is not None and best[0] >= self.stop_at:
+                for future in pending:
+                    future.cancel()
+                wait(pending)
+                break
+        return best
+
+
+def _tile_bounds(shape: Tuple[int, ...], templ_shape: Tuple[int, ...], count: int) -> List[Tuple[int, int, int, int]]:
+    """Split the longer axis into ``count`` strips that overlap by the template size."""
+    height, width = shape[:2]
+    th, tw = templ_shape[:2]
+    horizontal = width >= height
+    length, extent = (width, tw) if horizontal else (height, th)
+    positions = length - extent + 1
+    if positions <= 0:
+        return [(0, 0, width, height)]
+    count = max(1, min(count, positions))
+    step = int(math.ceil(positions / count))
+    bounds = []
+    for start in range(0, positions, step):
+        end = min(length, start + step + extent - 1)
+        bounds.append((start, 0, end, height) if horizontal else (0, start, width, end))
+    return bounds
+
+
+class _FullMatcher:
+    def __init__(self, backend: MatcherBackend) -> None:
+        self.backend = backend
+
+    def __call__(self, frame: _Frame, templ: np.ndarray) -> Match:
+        return self.backend.match(frame.full(), templ, _result_buffer(frame.pool, "full", frame.shape, templ.shape))
+
+
+class _PrefilterMatcher:
+    """Matches only inside the candidate windows of a ``ColorPrefilter``; no candidates scores 0."""
+
+    def __init__(self, prefilter: ColorPrefilter, backend: MatcherBackend) -> None:
+        self.prefilter = prefilter
+        self.backend = backend
+
+    def __call__(self, frame: _Frame, templ: np.ndarray) -> Match:
+        best: Match = (0.0, (0, 0))
+        for x0, y0, x1, y1 in self.prefilter.candidates(frame, templ.shape):
+            window = frame.window(x0, y0, x1, y1)
+            score, (x, y) = self.backend.match(window, templ, _result_buffer(frame.pool, "prefilter", window.shape, templ.shape, exact=False))
+            if score > best[0]:
+                best = (score, (x + x0, y + y0))
+        return best
+
+
+ENGINES: Dict[str, Callable[..., Matcher]] = {
+    "full": lambda backend, **_options: _FullMatcher(backend),
+    "pyramid": lambda backend, **_options: _PyramidMatcher(backend=backend),
+    "tiled": lambda backend, pool, workers, stop_at=None, **_options: _TiledMatcher(backend, pool, workers, stop_at),
+}
+
+
+class _FrameGate:
+    """Cheap change detector over a block-averaged fingerprint of the raw grab.
+
+    ``changed`` compares against the fingerprint of the last frame it let
+    through, so slow drift still triggers a rescore once it exceeds
+    ``tolerance`` grey levels in any block. ``generation`` counts the frames let
+    through, so scores can be tied to the reference they were taken on.
+    """
+
+    def __init__(self, tolerance: int = 3, block: int = 16) -> None:
+        self.tolerance = tolerance
+        self.block = max(1, block)
+        self._reference: Optional[np.ndarray] = None
+        self._current: Optional[np.ndarray] = None
+        self._diff: Optional[np.ndarray] = None
+        self.generation = 0
+
+    def reset(self) -> None:
+        self._reference = None
+        self.generation += 1
+
+    def changed(self, raw: np.ndarray) -> bool:
+        height, width = raw.shape[:2]
+        size = (max(1, width // self.block), max(1, height // self.block))
+        if self._reference is not None and self._reference.shape[1::-1] != size:
+            self._reference = None
+        if self._current is not None and self._current.shape[1::-1] != size:
+            self._current = None
+            self._diff = None
+        self._current = cv2.resize(raw, size, dst=self._current, interpolation=cv2.INTER_AREA)
+        if self._reference is not None:
+            self._diff = cv2.absdiff(self._current, self._reference, dst=self._diff)
+            if int(self._diff.max()) <= self.tolerance:
+                return False
+        self._reference, self._current = self._current, self._reference
+        self.generation += 1
+        return True
+
+
+class _QualityController:
+    """Holds the detector loop's duty cycle under ``budget`` (a fraction of one core).
+
+    The duty cycle is CPU time (grab to decision) over wall time, tracked as a
+    smoothed cost per frame for each quality level. ``update`` returns the
+    shortest poll period that keeps ``cost / period <= budget``. If even
+    ``max_period`` cannot, the engine steps down a level (only the cheapest
+    level may poll slower than ``max_period``); it steps back up once
+    the dearer level's known cost fits in ``headroom`` of ``max_period``, and
+    re-measures it every ``probe_seconds``. A score within ``near_margin`` of the
+    threshold restores full quality for ``hold_seconds``, polling as fast as
+    full quality's cost allows within the budget.
+
+    CPU time is ``time.process_time()``, so tiled workers count and preemption
+    does not, but so does every other thread of the process: with the detector
+    on a thread that includes the GUI, and only ``detector_process`` measures
+    the detector alone.
+    """
+
+    def __init__(
+        self,
+        engine: DetectionEngine,
+        budget: float,
+        max_period: float,
+        near_margin: float = 0.15,
+        hold_seconds: float = 5.0,
+        probe_seconds: float = 60.0,
+        headroom: float = 0.5,
+        smoothing: float = 0.2,
+    ) -> None:
+        self.engine = engine
+        self.budget = max(1e-3, budget)
+        self.max_period = max_period
+        self.near_margin = near_margin
+        self.hold_seconds = hold_seconds
+        self.probe_seconds = probe_seconds
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.costs: Dict[int, float] = {}
+        self._hold_until = 0.0
+        self._next_probe = 0.0
+
+    def record(self, busy_seconds: float) -> None:
+        level = self.engine.quality
+        cost = self.costs.get(level)
+        self.costs[level] = busy_seconds if cost is None else cost + self.smoothing * (busy_seconds - cost)
+
+    def update(self, now: float, score: float, threshold: float) -> float:
+        if score >= threshold - self.near_margin:
+            self._hold_until = now + self.hold_seconds
+            self.engine.set_quality(0)
+        if now < self._hold_until:
+            full = self.costs.get(0)
+            return 0.0 if full is None else full / self.budget
+        level = self.engine.quality
+        cost = self.costs.get(level)
+        if cost is None:
+            return 0.0
+        if cost / self.budget > self.max_period and level < len(QUALITY_LEVELS) - 1:
+            self.engine.set_quality(level + 1)
+            self._next_probe = now + self.probe_seconds
+            # Measure the cheaper level next rather than sitting out this level's debt.
+            return self.max_period
+        if level > 0:
+            if now >= self._next_probe:
+                # Costs drift (ROI locks, static screens); measure the dearer level again.
+                self.costs.pop(level - 1, None)
+                self._next_probe = now + self.probe_seconds
+            dearer = self.costs.get(level - 1)
+            if dearer is None or dearer / self.budget <= self.max_period * self.headroom:
+                self.engine.set_quality(level - 1)
+        return self.costs.get(self.engine.quality, cost) / self.budget
+
+
+class _DeadlineScheduler:
+    """Paces the capture loop on absolute deadlines instead of sleeping after the work.
+
+    ``wait(period)`` returns one ``period`` after the previous deadline, so work
+    time does not stretch the period and timing errors do not accumulate. When
+    the work overran, the late deadlines are skipped (and counted on
+    ``timings``) and the loop waits for the next one still ahead, so a loop that
+    always overruns still idles until the next period boundary rather than
+    running back to back. Waiting is on the ``stop`` event, so setting it wakes
+    the loop immediately.
+    """
+
+    def __init__(self, stop: threading.Event, timings: Optional[StageTimings] = None) -> None:
+        self.stop = stop
+        self.timings = timings
+        self.deadline: Optional[float] = None
+
+    def restart(self) -> None:
+        """Start a fresh schedule from now, e.g. after a pause that was not an overrun."""
+        self.deadline = None
+
+    def wait(self, period: float) -> bool:
+        """Block until the next deadline; True if stopped."""
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+        self.deadline += period
+        if now > self.deadline:
+            missed = int((now - self.deadline) // period) + 1
+            if self.timings is not None:
+                self.timings.overrun(missed)
+            self.deadline += missed * period
+        return self.stop.wait(self.deadline - now)
+
+
+class _AdaptivePoller:
+    """Poll delay that drops to ``min_ms`` while the screen changes or a score comes
+    within ``near_margin`` of the threshold, and backs off towards ``max_ms`` otherwise."""
+
+    def __init__(self, min_ms: int, max_ms: int, near_margin: float = 0.15, backoff: float = 1.5) -> None:
+        self.min_ms = max(10, min_ms)
+        self.max_ms = max(self.min_ms, max_ms)
+        self.near_margin = near_margin
+        self.backoff = max(1.0, backoff)
+        self.delay_ms = float(self.min_ms)
+
+    def next_delay(self, changed: bool, score: float, threshold: float) -> float:
+        if changed or score >= threshold - self.near_margin:
+            self.delay_ms = float(self.min_ms)
+        else:
+            self.delay_ms = min(float(self.max_ms), self.delay_ms * self.backoff)
+        return self.delay_ms / 1000.0
+
+
+class _RoiTracker:
+    """Restricts the search to where the template was last confidently found.
+
+    Until the first match every frame is a full-screen scan. Afterwards only the
+    learned window (template plus ``margin``) is searched, with a full scan every
+    ``full_scan_every`` frames or after ``max_misses`` consecutive ROI misses.
+    """
+
+    def __init__(self, margin: int, full_scan_every: int, max_misses: int, full_scan: Optional[Matcher] = None) -> None:
+        self.margin = max(0, margin)
+        self.full_scan = full_scan or _FullMatcher(OpenCvBackend())
+        self.full_scan_every = max(1, full_scan_every)
+        self.max_misses = max(1, max_misses)
+        self.roi: Optional[Tuple[int, int, int, int]] = None
+        self._frames_since_full = 0
+        self._misses = 0
+
+    def match(self, frame: _Frame, templ: np.ndarray, threshold: float) -> Match:
+        window = self._window(frame.shape)
+        if window is None:
+            score, loc = self.full_scan(frame, templ)
+            self._frames_since_full = 0
+            self._misses = 0
+        else:
+            x0, y0, x1, y1 = window
+            window = frame.window(x0, y0, x1, y1)
+            score, (x, y) = _template_match(window, templ, _result_buffer(frame.pool, "roi", window.shape, templ.shape, exact=False))
+            loc = (x + x0, y + y0)
+            self._frames_since_full += 1
+            self._misses = 0 if score >= threshold else self._misses + 1
+        if score >= threshold:
+            th, tw = templ.shape[:2]
+            self.roi = (loc[0] - self.margin, loc[1] - self.margin, tw + 2 * self.margin, th + 2 * self.margin)
+        return score, loc
+
+    def _window(self, shape: Tuple[int, ...]) -> Optional[Tuple[int, int, int, int]]:
+        if self.roi is None or self._frames_since_full >= self.full_scan_every or self._misses >= self.max_misses:
+            return None
+        x, y, w, h = self.roi
+        height, width = shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + w), min(height, y + h)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
@@ -0,0 +1,185 @@
+"""
+Detector service - runs the detection loop in its own process.
+
+The GUI process starts and supervises it through DetectorProcess, which mirrors
+the DetectorThread signals. Frames are captured, matched and notified entirely
+in the child, so UI work in the GUI (dialogs, stats refreshes) never delays a
+frame and the window can be hidden to the tray while tracking continues.
+Events travel back over a multiprocessing pipe as small tuples.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Optional
+
+from PyQt6 import QtCore
+
+# Restarts allowed within RESTART_WINDOW seconds before the supervisor gives up.
+MAX_RESTARTS = 3
+RESTART_WINDOW = 60.0
+
+
+def service_main(conn: Connection, options: Dict[str, Any], user_id: str, message: str) -> None:
+    """Entry point of the detector process: run a DetectorThread's loop until told to stop."""
+    # Imported here so the GUI process does not pay for them when it only supervises.
+    from detector import DetectorThread
+    from firebase_client import send_notification
+
+    send_lock = threading.Lock()
+
+    def send(*event: Any) -> None:
+        with send_lock:
+            try:
+                conn.send(event)
+            except (BrokenPipeError, EOFError, OSError):
+                detector.stop()
+
+    def on_match(_event: str) -> bool:
+        try:
+            result = send_notification(user_id, message)
+        except Exception as exc:
+            send("send_failed", str(exc))
+            return False
+        send("sent", result.sent, result.total)
+        return result.sent > 0
+
+    def watch_parent() -> None:
+        # Any command, or the GUI going away, stops the loop.
+        try:
+            conn.recv()
+        except (EOFError, OSError):
+            pass
+        detector.stop()
+
+    try:
+        detector = DetectorThread(on_match=on_match, **options)
+    except ValueError as exc:
+        # Bad options would fail the same way on every restart; report and stop cleanly.
+        conn.send(("status", f"Detector error: {exc}"))
+        conn.send(("stopped",))
+        return
+    # No event loop runs here, so queued delivery (signals from the sender or
+    # pipeline threads) would never arrive; deliver in the emitting thread instead.
+    direct = QtCore.Qt.ConnectionType.DirectConnection
+    detector.status.connect(lambda text: send("status", text), direct)
+    detector.match_detected.connect(lambda name, score: send("match", name, score), direct)
+    detector.timings_updated.connect(lambda timings: send("timings", timings), direct)
+    threading.Thread(target=watch_parent, name="omnicall-service-control", daemon=True).start()
+    # The loop runs on this process's main thread; DetectorThread is only used for its logic and signals.
+    detector.run()
+    send("stopped")
+
+
+class DetectorProcess(QtCore.QObject):
+    """GUI-side handle on the detector process, interchangeable with DetectorThread.
+
+    A reader thread turns pipe messages into Qt signals. If the process dies
+    without being asked to stop it is restarted, up to ``MAX_RESTARTS`` times per
+    ``RESTART_WINDOW`` seconds. A loop that ended by itself (template error,
+    replay finished) says so with ``"stopped"`` and is not restarted.
+    """
+
+    # (template name, score)
+    match_detected = QtCore.pyqtSignal(str, float)
+    status = QtCore.pyqtSignal(str)
+    timings_updated = QtCore.pyqtSignal(dict)
+    # (devices reached, devices total), as MainWindow.sendResult
+    send_result = QtCore.pyqtSignal(int, int)
+    send_failed = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, options: Dict[str, Any], user_id: str, message: str, parent: Optional[QtCore.QObject] = None) -> None:
+        super().__init__(parent)
+        self.options = options
+        self.user_id = user_id
+        self.message = message
+        self._context = multiprocessing.get_context("spawn")
+        self._process: Optional[multiprocessing.process.BaseProcess] = None
+        self._conn: Optional[Connection] = None
+        self._reader: Optional[threading.Thread] = None
+        self._stopping = False
+        self._restarts: list = []
+
+    def start(self) -> None:
+        self._stopping = False
+        self._spawn()
+
+    def stop(self) -> None:
+        self._stopping = True
+        if self._conn is not None:
+            try:
+                self._conn.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+
+    def isRunning(self) -> bool:
+        return self._reader is not None and self._reader.is_alive()
+
+    def wait(self, msecs: int = 2000) -> bool:
+        """Wait for the process to exit, killing it if it has not stopped by then."""
+        process = self._process
+        if process is None:
+            return True
+        process.join(msecs / 1000.0)
+        if process.is_alive():
+            process.kill()
+            process.join(1.0)
+        if self._reader is not None:
+            self._reader.join(1.0)
+        return not process.is_alive()
+
+    def _spawn(self) -> None:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=service_main,
+            args=(child_conn, self.options, self.user_id, self.message),
+            name="omnicall-detector",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self._process, self._conn = process, parent_conn
+        self._reader = threading.Thread(target=self._read, args=(process, parent_conn), name="omnicall-service-reader", daemon=True)
+        self._reader.start()
+
+    def _read(self, process: multiprocessing.process.BaseProcess, conn: Connection) -> None:
+        stopped = False
+        while True:
+            try:
+                event = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = event[0]
+            if kind == "status":
+                self.status.emit(event[1])
+            elif kind == "match":
+                self.match_detected.emit(event[1], event[2])
+            elif kind == "timings":
+                self.timings_updated.emit(event[1])
+            elif kind == "sent":
+                self.send_result.emit(event[1], event[2])
+            elif kind == "send_failed":
+                self.send_failed.emit(event[1])
+            elif kind == "stopped":
+                stopped = True
+                break
+        process.join(2.0)
+        conn.close()
+        crashed = not stopped or bool(process.exitcode)
+        if crashed and not self._stopping and self._may_restart():
+            self.status.emit(f"Detector process exited (code {process.exitcode}); restarting")
+            self._spawn()
+            return
+        self.finished.emit()
+
+    def _may_restart(self) -> bool:
+        now = time.monotonic()
+        self._restarts = [stamp for stamp in self._restarts if now - stamp < RESTART_WINDOW]
+        if len(self._restarts) >= MAX_RESTARTS:
+            return False
+        self._restarts.append(now)
+        return True
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import multiprocessing
 import os
 import sys
 from datetime import datetime, timezone
@@ -22,7 +23,8 @@ if str(BASE_DIR) not in sys.path:
     sys.path.insert(0, str(BASE_DIR))
 
 from config import load_config, save_config
-from detector import DetectorThread
+from detector import ACCEPT_BUTTON_PREFILTER, SHARED_FRAMES_NAME, DetectorThread, FlightRecorder, TemplateSpec, list_monitors
+from detector_service import DetectorProcess
 from firebase_client import (
     DEFAULT_MESSAGE,
     PWA_URL,
@@ -233,19 +235,28 @@ QPushButton[variant="ghost"] {
     border: none;
     color: #e7ecf3;
 }
-QLineEdit, QPlainTextEdit, QTextEdit, QSpinBox, QDoubleSpinBox {
+QLineEdit, QPlainTextEdit, QTextEdit, QSpinBox, QDoubleSpinBox, QComboBox {
     background: rgba(20, 24, 34, 0.86);
     border: 1px solid rgba(255, 255, 255, 0.14);
     border-radius: 12px;
     padding: 8px 12px;
     color: #e7ecf3;
 }
-QLineEdit:focus, QPlainTextEdit:focus, QTextEdit:focus, QSpinBox:focus, QDoubleSpinBox:focus {
+QLineEdit:focus, QPlainTextEdit:focus, QTextEdit:focus, QSpinBox:focus, QDoubleSpinBox:focus, QComboBox:focus {
     border-color: rgba(76, 175, 80, 0.6);
 }
 QDoubleSpinBox::up-button, QSpinBox::up-button, QDoubleSpinBox::down-button, QSpinBox::down-button {
     background: transparent;
 }
+QComboBox::drop-down {
+    border: none;
+    width: 24px;
+}
+QComboBox QAbstractItemView {
+    background: #141822;
+    color: #e7ecf3;
+    selection-background-color: rgba(76, 175, 80, 0.35);
+}
 QScrollArea, QScrollArea QWidget {
     background: transparent;
 }
@@ -785,6 +796,56 @@ class PairingDialog(QtWidgets.QDialog):
         layout.addWidget(card)
 
 
+class CaptureRegionDialog(QtWidgets.QDialog):
+    def __init__(self, region: Optional[list], desktop: dict, parent: Optional[QtWidgets.QWidget] = None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle("Custom capture region")
+        if not APP_ICON.isNull():
+            self.setWindowIcon(APP_ICON)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(24, 24, 24, 18)
+        layout.setSpacing(16)
+
+        card = _create_card()
+        card_layout = card.layout()
+        hint = QtWidgets.QLabel("Only this rectangle is scanned. Coordinates are in desktop pixels.")
+        hint.setWordWrap(True)
+        _apply_property(hint, "variant", "subtle")
+        card_layout.addWidget(hint)
+
+        left, top = desktop["left"], desktop["top"]
+        right, bottom = left + desktop["width"], top + desktop["height"]
+        x, y, width, height = region or (left, top, desktop["width"], desktop["height"])
+        form = QtWidgets.QFormLayout()
+        self.x_input = self._spin(left, right - 1, x)
+        self.y_input = self._spin(top, bottom - 1, y)
+        self.width_input = self._spin(1, desktop["width"], width)
+        self.height_input = self._spin(1, desktop["height"], height)
+        form.addRow(_form_label("Left"), self.x_input)
+        form.addRow(_form_label("Top"), self.y_input)
+        form.addRow(_form_label("Width"), self.width_input)
+        form.addRow(_form_label("Height"), self.height_input)
+        card_layout.addLayout(form)
+        layout.addWidget(card)
+
+        buttons = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.StandardButton.Ok | QtWidgets.QDialogButtonBox.StandardButton.Cancel
+        )
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    @staticmethod
+    def _spin(minimum: int, maximum: int, value: int) -> QtWidgets.QSpinBox:
+        spin = QtWidgets.QSpinBox()
+        spin.setRange(minimum, maximum)
+        spin.setValue(int(value))
+        return spin
+
+    def region(self) -> list:
+        return [self.x_input.value(), self.y_input.value(), self.width_input.value(), self.height_input.value()]
+
+
 class MainWindow(QtWidgets.QMainWindow):
     sendResult = QtCore.pyqtSignal(int, int)
     statusMessage = QtCore.pyqtSignal(str)
@@ -792,7 +853,8 @@ class MainWindow(QtWidgets.QMainWindow):
     def __init__(self, cfg: dict) -> None:
         super().__init__()
         self.cfg = cfg
-        self.detector: Optional[DetectorThread] = None
+        self.detector: Optional[DetectorThread | DetectorProcess] = None
+        self.flight_recorder: Optional[FlightRecorder] = None
         self.setWindowTitle(APP_NAME)
         if not APP_ICON.isNull():
             self.setWindowIcon(APP_ICON)
@@ -841,6 +903,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.toggle_action.setShortcuts([QtGui.QKeySequence("Ctrl+T"), QtGui.QKeySequence("F8")])
         self.toggle_action.triggered.connect(self._toggle_tracking_shortcut)
         self.addAction(self.toggle_action)
+        self.record_action = QtGui.QAction("Save Detector Recording", self)
+        self.record_action.setShortcut(QtGui.QKeySequence("F9"))
+        self.record_action.triggered.connect(self._save_recording)
+        self.addAction(self.record_action)
 
         self.statusBar().showMessage("Ready")
         self._refresh_stats()
@@ -862,9 +928,48 @@ class MainWindow(QtWidgets.QMainWindow):
         self.cache_refresh_timer.timeout.connect(lambda: refresh_token_cache(self.cfg["user_id"]))
         self.cache_refresh_timer.start(300_000)  # 5 minutes
 
+        self.tray = self._build_tray()
+
+    def _build_tray(self) -> Optional[QtWidgets.QSystemTrayIcon]:
+        if not QtWidgets.QSystemTrayIcon.isSystemTrayAvailable():
+            return None
+        tray = QtWidgets.QSystemTrayIcon(APP_ICON, self)
+        tray.setToolTip(APP_NAME)
+        menu = QtWidgets.QMenu(self)
+        menu.addAction("Show OmniCall", self._show_from_tray)
+        menu.addAction("Quit", self._quit)
+        tray.setContextMenu(menu)
+        tray.activated.connect(
+            lambda reason: self._show_from_tray() if reason == QtWidgets.QSystemTrayIcon.ActivationReason.Trigger else None
+        )
+        tray.show()
+        # The tray owns the app's lifetime: closing the window while tracking only hides it.
+        QtWidgets.QApplication.setQuitOnLastWindowClosed(False)
+        return tray
+
+    def _show_from_tray(self) -> None:
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
+    def _quit(self) -> None:
+        self._stop_detector()
+        if self.tray is not None:
+            self.tray.hide()
+        QtWidgets.QApplication.quit()
+
     def closeEvent(self, event: QtGui.QCloseEvent) -> None:
+        if self.tray is not None and self.detector and self.detector.isRunning():
+            # Keep tracking in the background; quit from the tray menu.
+            event.ignore()
+            self.hide()
+            self.tray.showMessage(APP_NAME, "Still tracking. Quit from the tray icon.", APP_ICON, 4000)
+            return
         self._stop_detector()
         super().closeEvent(event)
+        if self.tray is not None:
+            self.tray.hide()
+            QtWidgets.QApplication.quit()
         
     def _toggle_tracking_shortcut(self) -> None:
         if not self.toggle_button.isEnabled():
@@ -980,6 +1085,17 @@ class MainWindow(QtWidgets.QMainWindow):
         buttons_row.addWidget(self.toggle_button)
         buttons_row.addStretch(1)
 
+        # Capture area: all screens, one monitor or a custom rectangle
+        capture_row = QtWidgets.QHBoxLayout()
+        capture_row.setSpacing(12)
+        self.capture_combo = QtWidgets.QComboBox()
+        self.capture_combo.setMinimumWidth(320)
+        self._populate_capture_combo()
+        self.capture_combo.activated.connect(self._handle_capture_choice)
+        capture_row.addWidget(_form_label("Capture area"))
+        capture_row.addWidget(self.capture_combo)
+        capture_row.addStretch(1)
+
         # Status message
         self.detector_status = QtWidgets.QLabel()
         self.detector_status.setWordWrap(True)
@@ -989,6 +1105,7 @@ class MainWindow(QtWidgets.QMainWindow):
         card_layout.addWidget(hello)
         card_layout.addWidget(self.notification_state)
         card_layout.addLayout(buttons_row)
+        card_layout.addLayout(capture_row)
         card_layout.addWidget(self.detector_status)
         card_layout.addStretch(1)
 
@@ -998,6 +1115,51 @@ class MainWindow(QtWidgets.QMainWindow):
         outer.addStretch(1)
         return w
 
+    def _populate_capture_combo(self) -> None:
+        try:
+            self._monitors = list_monitors()
+        except Exception:
+            self._monitors = []
+        combo = self.capture_combo
+        combo.clear()
+        for index, monitor in enumerate(self._monitors):
+            size = f"{monitor['width']}x{monitor['height']}"
+            if index == 0:
+                combo.addItem(f"All screens ({size})", 0)
+            else:
+                combo.addItem(f"Screen {index} — {size} at ({monitor['left']}, {monitor['top']})", index)
+        region = self.cfg.get("capture_region")
+        region_label = "Custom region…"
+        if region:
+            x, y, width, height = region
+            region_label = f"Custom region — {width}x{height} at ({x}, {y})"
+        combo.addItem(region_label, -1)  # -1 marks the custom region entry
+        if region:
+            combo.setCurrentIndex(combo.count() - 1)
+        else:
+            selected = combo.findData(int(self.cfg.get("capture_monitor", 0)))
+            combo.setCurrentIndex(max(selected, 0))
+
+    def _handle_capture_choice(self, index: int) -> None:
+        monitor = self.capture_combo.itemData(index)
+        if monitor >= 0:
+            self.cfg["capture_monitor"] = monitor
+            self.cfg["capture_region"] = None
+        else:
+            desktop = self._monitors[0] if self._monitors else {"left": 0, "top": 0, "width": 7680, "height": 4320}
+            dialog = CaptureRegionDialog(self.cfg.get("capture_region"), desktop, self)
+            if dialog.exec() != QtWidgets.QDialog.DialogCode.Accepted:
+                self._populate_capture_combo()
+                return
+            self.cfg["capture_region"] = dialog.region()
+        save_config(self.cfg)
+        self._populate_capture_combo()
+        if self.detector and self.detector.isRunning():
+            # The capture area is fixed per detector run, so restart to apply it.
+            self._stop_detector()
+            self._start_detector()
+        self.statusBar().showMessage("Capture area updated", 4000)
+
     def _set_tracking_state(self, active: bool, detail: Optional[str] = None) -> None:
         """Update toggle button state and text."""
         with QtCore.QSignalBlocker(self.toggle_button):
@@ -1066,8 +1228,39 @@ class MainWindow(QtWidgets.QMainWindow):
         threshold = 0.7  # Lower threshold for better detection
         debounce_seconds = 4  # 4-second cooldown between notifications (keep alerting user)
         poll_ms = 250
+        min_poll_ms = int(self.cfg.get("poll_min_ms", 50))  # Fast polling while the screen changes
+        max_poll_ms = int(self.cfg.get("poll_max_ms", 1000))  # Ceiling while the screen is static
+        capture_monitor = int(self.cfg.get("capture_monitor", 0))  # 0 = all screens
+        capture_region = self.cfg.get("capture_region")  # [left, top, width, height] overrides the monitor
+        pipeline_consumers = int(self.cfg.get("pipeline_consumers", 0))  # Matcher threads; 0 matches on the capture thread
+        prefilter = ACCEPT_BUTTON_PREFILTER if self.cfg.get("color_prefilter") else None  # Skip frames without the button's colour
+        publish_frames = SHARED_FRAMES_NAME if self.cfg.get("publish_frames") else None  # Share grabs with other OmniCall processes
+        cpu_budget = self.cfg.get("cpu_budget")  # e.g. 0.05 = at most 5% of one core; None = unlimited
+        options = dict(
+            template_path=str(path),
+            threshold=threshold,
+            debounce_seconds=debounce_seconds,
+            poll_ms=poll_ms,
+            engine="pyramid",
+            min_poll_ms=min_poll_ms,
+            max_poll_ms=max_poll_ms,
+            capture_monitor=capture_monitor,
+            capture_region=capture_region,
+            pipeline_consumers=pipeline_consumers,
+            templates=[TemplateSpec(str(path), threshold, prefilter=prefilter)],
+            publish_frames=publish_frames,
+            cpu_budget=float(cpu_budget) if cpu_budget else None,
+        )
+
+        if self.cfg.get("detector_process"):
+            # Separate process: UI stalls cannot delay frames; it sends notifications itself.
+            self.detector = DetectorProcess(options, self.cfg["user_id"], DEFAULT_MESSAGE)
+            self.detector.send_result.connect(self._handle_send_result)
+            self.detector.send_failed.connect(lambda reason: self._show_status(f"Send failed: {reason}"))
+            self._launch_detector()
+            return
 
-        def on_match() -> bool:
+        def on_match(_event: str) -> bool:
             try:
                 result = send_notification(self.cfg["user_id"], DEFAULT_MESSAGE)
             except Exception as exc:
@@ -1076,13 +1269,19 @@ class MainWindow(QtWidgets.QMainWindow):
             self.sendResult.emit(result.sent, result.total)
             return result.sent > 0
 
-        self.detector = DetectorThread(
-            template_path=str(path),
-            threshold=threshold,
-            debounce_seconds=debounce_seconds,
-            poll_ms=poll_ms,
-            on_match=on_match,
-        )
+        if self.cfg.get("flight_recorder"):
+            # Last few seconds of frames and scores, saved on a match, a near miss or F9 (thread mode only).
+            self.flight_recorder = FlightRecorder(
+                seconds=float(self.cfg.get("flight_recorder_seconds", 10)),
+                max_bytes=int(float(self.cfg.get("flight_recorder_mb", 16)) * 1024 * 1024),
+                max_dumps=int(self.cfg.get("flight_recorder_dumps", 20)),  # Oldest saved recordings are deleted beyond this
+            )
+        else:
+            self.flight_recorder = None
+        self.detector = DetectorThread(on_match=on_match, flight_recorder=self.flight_recorder, **options)
+        self._launch_detector()
+
+    def _launch_detector(self) -> None:
         self.detector.match_detected.connect(self._on_match_detected)
         self.detector.status.connect(self._on_detector_status)
         self.detector.finished.connect(self._on_detector_finished)
@@ -1130,18 +1329,28 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @QtCore.pyqtSlot()
     def _on_detector_finished(self) -> None:
+        # Queued: a detector replaced by a restart finishes after its successor has started.
+        if self.sender() is not self.detector:
+            return
         self.detector = None
         self._set_tracking_state(False, "Tracking idle")
         self.statusBar().showMessage("Tracking stopped", 4000)
 
-    @QtCore.pyqtSlot(float)
-    def _on_match_detected(self, score: float) -> None:
+    @QtCore.pyqtSlot(str, float)
+    def _on_match_detected(self, _event: str, score: float) -> None:
         self._set_tracking_state(True, "Match detected! Sending notification...")
 
     @QtCore.pyqtSlot(str)
     def _show_status(self, message: str) -> None:
         self.statusBar().showMessage(message, 6000)
 
+    def _save_recording(self) -> None:
+        if self.flight_recorder is None:
+            self.statusBar().showMessage("Flight recorder is off (set flight_recorder in config)", 5000)
+            return
+        target = self.flight_recorder.dump("manual")
+        self.statusBar().showMessage(f"Saving recording to {target}", 6000)
+
     def _stop_detector(self) -> None:
         was_running = bool(self.detector and self.detector.isRunning())
         if self.detector and self.detector.isRunning():
@@ -1580,4 +1789,6 @@ def main() -> int:
 
 
 if __name__ == "__main__":
+    # Needed for the detector process in frozen (PyInstaller) builds.
+    multiprocessing.freeze_support()
     sys.exit(main())